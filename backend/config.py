@@ -1,6 +1,5 @@
 """Application configuration using Pydantic Settings."""
 from pydantic_settings import BaseSettings
-from functools import lru_cache
 
 
 class Settings(BaseSettings):
@@ -10,6 +9,12 @@ class Settings(BaseSettings):
     neo4j_uri: str = "bolt://localhost:7687"
     neo4j_user: str = "neo4j"
     neo4j_password: str = "password"
+    neo4j_database: str = "neo4j"
+    
+    # Neo4j driver connection pool (size for uvicorn workers x concurrent requests)
+    neo4j_max_connection_pool_size: int = 100
+    neo4j_connection_acquisition_timeout: float = 60.0
+    neo4j_max_connection_lifetime: float = 3600.0
     
     # Anthropic Claude API
     anthropic_api_key: str = ""
@@ -20,6 +25,8 @@ class Settings(BaseSettings):
     
     # App Settings
     debug: bool = True
+    # Worker threads shared by Gradio calls and file I/O (asyncio's default executor)
+    thread_pool_size: int = 8
     cors_origins: list[str] = ["http://localhost:3000", "http://localhost:5173"]
     
     class Config:
@@ -27,7 +34,12 @@ class Settings(BaseSettings):
         env_file_encoding = "utf-8"
 
 
-@lru_cache
+_settings: Settings | None = None
+
+
 def get_settings() -> Settings:
-    """Get cached settings instance."""
-    return Settings()
+    """Get the process-wide settings instance, created on first use."""
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
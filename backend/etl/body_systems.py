@@ -4,6 +4,10 @@ Medical Knowledge Base - Body System Mappings.
 Maps ICD-10 condition codes and medication codes to body systems
 for visualization and explanation generation.
 """
+import sys
+from collections.abc import Mapping
+from functools import lru_cache
+from types import MappingProxyType
 
 # ICD-10 Condition Code → Body System Mapping
 CONDITION_TO_BODY_SYSTEM = {
@@ -136,36 +140,67 @@ MEDICATION_TO_TARGET = {
 }
 
 
-def get_body_system_for_condition(icd_code: str) -> dict:
+def _canonicalize(table: dict) -> Mapping[str, Mapping[str, str]]:
+    """
+    Share one read-only mapping between codes with identical values.
+    
+    Many codes map to the same system/description, so equal entries are
+    collapsed to a single interned MappingProxyType instead of a fresh dict each.
+    """
+    canon = {}
+    result = {}
+    for code, value in table.items():
+        key = tuple(sorted(value.items()))
+        shared = canon.get(key)
+        if shared is None:
+            shared = MappingProxyType({k: sys.intern(v) for k, v in value.items()})
+            canon[key] = shared
+        result[code] = shared
+    return result
+
+
+CONDITION_TO_BODY_SYSTEM = _canonicalize(CONDITION_TO_BODY_SYSTEM)
+MEDICATION_TO_TARGET = _canonicalize(MEDICATION_TO_TARGET)
+
+# Bound lookups, resolved once instead of per call
+_lookup_body_system = CONDITION_TO_BODY_SYSTEM.get
+_lookup_target = MEDICATION_TO_TARGET.get
+
+# Fallbacks for codes missing from the knowledge base
+_DEFAULT_BODY_SYSTEM = MappingProxyType({
+    "system": "Body",
+    "subsystem": "Unknown",
+    "description": "Part of your body"
+})
+_DEFAULT_TARGET = MappingProxyType({
+    "target": "Body",
+    "action": "Helps with treatment"
+})
+
+
+@lru_cache(maxsize=2048)
+def get_body_system_for_condition(icd_code: str) -> Mapping[str, str]:
     """
     Look up body system for an ICD-10 code.
     
-    Tries exact match first, then 3-character category.
+    Tries exact match first, then 3-character category. Results are
+    cached since a handful of codes dominate real cohorts; the returned
+    mapping is shared and read-only.
     
     Args:
         icd_code: ICD-10 diagnosis code
         
     Returns:
-        Dictionary with system, subsystem, and description
+        Read-only mapping with system, subsystem, and description
     """
-    # Try exact match
-    if icd_code in CONDITION_TO_BODY_SYSTEM:
-        return CONDITION_TO_BODY_SYSTEM[icd_code]
-    
-    # Try 3-character category
-    prefix = icd_code[:3] if len(icd_code) >= 3 else icd_code
-    if prefix in CONDITION_TO_BODY_SYSTEM:
-        return CONDITION_TO_BODY_SYSTEM[prefix]
-    
-    # Unknown
-    return {
-        "system": "Body",
-        "subsystem": "Unknown",
-        "description": "Part of your body"
-    }
+    return (
+        _lookup_body_system(icd_code)
+        or _lookup_body_system(icd_code[:3], _DEFAULT_BODY_SYSTEM)
+    )
 
 
-def get_target_for_medication(med_code: str) -> dict:
+@lru_cache(maxsize=2048)
+def get_target_for_medication(med_code: str) -> Mapping[str, str]:
     """
     Look up target body system for a medication code.
     
@@ -173,12 +208,6 @@ def get_target_for_medication(med_code: str) -> dict:
         med_code: ATC or RxNorm medication code
         
     Returns:
-        Dictionary with target and action
+        Read-only mapping with target and action
     """
-    if med_code in MEDICATION_TO_TARGET:
-        return MEDICATION_TO_TARGET[med_code]
-    
-    return {
-        "target": "Body",
-        "action": "Helps with treatment"
-    }
+    return _lookup_target(med_code, _DEFAULT_TARGET)
@@ -4,18 +4,164 @@ FHIR to Neo4j ETL Loader.
 Loads FHIR R4 resources (Patient, Condition, MedicationRequest) into Neo4j
 and creates relationships with body systems knowledge graph.
 """
-import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Optional
 
-from neo4j import GraphDatabase
-from fhir.resources.bundle import Bundle
-from fhir.resources.patient import Patient
-from fhir.resources.condition import Condition
-from fhir.resources.medicationrequest import MedicationRequest
+import ijson
+import orjson
+from neo4j import Driver, GraphDatabase
 
 from .body_systems import CONDITION_TO_BODY_SYSTEM, MEDICATION_TO_TARGET
 
+logger = logging.getLogger(__name__)
+
+# Bundle files above this size are streamed entry by entry instead of parsed whole
+STREAMING_THRESHOLD_BYTES = 32 * 1024 * 1024
+# Entries per write transaction when streaming
+STREAMING_BATCH_SIZE = 1000
+
+
+def _get(data, *keys):
+    """
+    Walk nested FHIR JSON by dict keys / list indexes.
+    
+    Returns None as soon as a key or index is missing.
+    """
+    for key in keys:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return data
+
+
+# One driver per connection target, shared by every loader in the process
+_drivers: dict[tuple[str, str, str], Driver] = {}
+_drivers_lock = threading.Lock()
+
+# (uri, user, database) targets whose constraints and body systems exist
+_initialized_targets: set[tuple[str, str, str]] = set()
+_initialized_lock = threading.Lock()
+
+
+def _shared_driver(uri: str, user: str, password: str) -> Driver:
+    """
+    Get the process-wide driver for a connection target.
+    
+    Creating a driver pays the TLS handshake and routing-table fetch, so
+    loaders for the same target share one pooled driver.
+    """
+    key = (uri, user, password)
+    with _drivers_lock:
+        driver = _drivers.get(key)
+        if driver is None:
+            driver = GraphDatabase.driver(
+                uri, auth=(user, password), max_connection_pool_size=50
+            )
+            _drivers[key] = driver
+        return driver
+
+
+def shutdown_all():
+    """Close every shared driver; call once at process exit."""
+    with _drivers_lock:
+        for driver in _drivers.values():
+            driver.close()
+        _drivers.clear()
+
+
+def _empty_stats() -> dict:
+    """Zeroed per-bundle load counters."""
+    return {
+        "patients": 0,
+        "conditions": 0,
+        "medications": 0,
+        "body_systems": 0
+    }
+
+
+def _add_stats(total: dict, stats: dict):
+    """Accumulate per-batch load counters into a running total."""
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+
+
+# Cypher is kept in module-level constants so every bundle sends identical
+# query text and hits Neo4j's plan cache.
+_CONSTRAINTS = [
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (p:Patient) REQUIRE p.id IS UNIQUE",
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (c:Condition) REQUIRE c.code IS UNIQUE",
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (m:Medication) REQUIRE m.code IS UNIQUE",
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (bs:BodySystem) REQUIRE bs.name IS UNIQUE",
+]
+
+_Q_PATIENTS = """
+UNWIND $rows AS row
+MERGE (p:Patient {id: row.id})
+SET p.name = row.name,
+    p.birthDate = row.birthDate,
+    p.gender = row.gender
+"""
+
+_Q_CONDITIONS = """
+UNWIND $rows AS row
+MATCH (p:Patient {id: row.patient_id})
+MERGE (c:Condition {code: row.code})
+SET c.display = row.display,
+    c.system = row.system
+MERGE (p)-[:HAS_CONDITION {onsetDate: row.onset}]->(c)
+CALL {
+    WITH c, row
+    WITH c, row.body_system AS bs
+    WHERE bs IS NOT NULL
+    MATCH (b:BodySystem {name: bs.name})
+    MERGE (c)-[:AFFECTS {subsystem: bs.subsystem}]->(b)
+}
+"""
+
+_Q_MEDICATIONS = """
+UNWIND $rows AS row
+MATCH (p:Patient {id: row.patient_id})
+MERGE (m:Medication {code: row.code})
+SET m.display = row.display,
+    m.system = row.system
+MERGE (p)-[:TAKES_MEDICATION]->(m)
+CALL {
+    WITH m, row
+    WITH m, row.target AS t
+    WHERE t IS NOT NULL
+    MATCH (b:BodySystem {name: t.name})
+    MERGE (m)-[:TARGETS {action: t.action}]->(b)
+}
+"""
+
+# Used to preload the knowledge base at startup and for any body system this
+# loader has not merged yet; the link queries above can then MATCH the node.
+_Q_BODY_SYSTEMS = """
+UNWIND $rows AS row
+MERGE (b:BodySystem {name: row.name})
+ON CREATE SET b.description = row.description
+"""
+
+
+def _knowledge_base_body_systems() -> list[dict]:
+    """All body systems referenced by the knowledge base, as preload rows."""
+    descriptions = {}
+    for mapping in CONDITION_TO_BODY_SYSTEM.values():
+        descriptions.setdefault(mapping["system"], mapping.get("description", ""))
+    for mapping in MEDICATION_TO_TARGET.values():
+        descriptions.setdefault(mapping["target"], None)
+    return [
+        {"name": name, "description": description}
+        for name, description in descriptions.items()
+    ]
+
+
+_BODY_SYSTEM_ROWS = _knowledge_base_body_systems()
+
 
 class FHIRToNeo4jLoader:
     """
@@ -35,230 +181,285 @@ class FHIRToNeo4jLoader:
     - (Medication)-[:TARGETS]->(BodySystem)
     """
     
-    def __init__(self, uri: str, user: str, password: str):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
-        self._init_constraints()
+    def __init__(
+        self,
+        uri: str,
+        user: str,
+        password: str,
+        validate: bool = False,
+        database: str = "neo4j"
+    ):
+        self.driver = _shared_driver(uri, user, password)
+        # Naming the database up front skips the home-database lookup per session
+        self.database = database
+        # Full fhir.resources validation is a debug aid; the loader only
+        # reads a handful of fields straight from the raw JSON.
+        self.validate = validate
+        # Constraints are idempotent; only the first loader per target creates them
+        target = (uri, user, database)
+        with _initialized_lock:
+            if target not in _initialized_targets:
+                self._init_constraints()
+                _initialized_targets.add(target)
+        # BodySystem names known to exist; the preload above has run for this target
+        self._body_systems_created: set[str] = {row["name"] for row in _BODY_SYSTEM_ROWS}
     
     def close(self):
-        """Close the Neo4j driver connection."""
-        self.driver.close()
+        """
+        Release this loader.
+        
+        The shared driver stays open for other loaders; use shutdown_all()
+        to close it at process exit.
+        """
+        self.driver = None
     
     def _init_constraints(self):
-        """Create uniqueness constraints for node IDs."""
-        constraints = [
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (p:Patient) REQUIRE p.id IS UNIQUE",
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (c:Condition) REQUIRE c.code IS UNIQUE",
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (m:Medication) REQUIRE m.code IS UNIQUE",
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (bs:BodySystem) REQUIRE bs.name IS UNIQUE",
-        ]
-        
-        with self.driver.session() as session:
-            for constraint in constraints:
-                try:
-                    session.run(constraint)
-                except Exception as e:
-                    print(f"Constraint may already exist: {e}")
+        """
+        Create uniqueness constraints for node IDs and preload body systems.
+        
+        All knowledge-base BodySystem nodes are created up front in one UNWIND,
+        so bundle loads only MATCH them when linking.
+        """
+        def create_constraints(tx):
+            for constraint in _CONSTRAINTS:
+                tx.run(constraint)
+        
+        # IF NOT EXISTS already makes re-runs a no-op; real failures should surface
+        with self.driver.session(database=self.database) as session:
+            session.execute_write(create_constraints)
+            # Schema changes and data writes cannot share a transaction
+            session.execute_write(
+                lambda tx: tx.run(_Q_BODY_SYSTEMS, rows=_BODY_SYSTEM_ROWS).consume()
+            )
     
     def load_bundle_file(self, bundle_path: Path) -> dict:
         """
         Load a FHIR Bundle JSON file into Neo4j.
         
+        Files larger than STREAMING_THRESHOLD_BYTES are streamed with ijson
+        and written in batches of STREAMING_BATCH_SIZE entries, so peak memory
+        stays bounded by the batch rather than the file. Each batch commits on
+        its own, so a failure part-way leaves earlier batches loaded.
+        
         Args:
             bundle_path: Path to FHIR Bundle JSON file
             
         Returns:
             Dictionary with counts of loaded resources
         """
-        with open(bundle_path) as f:
-            bundle_data = json.load(f)
+        if not self.validate and bundle_path.stat().st_size > STREAMING_THRESHOLD_BYTES:
+            return self._stream_bundle_file(bundle_path)
+        
+        with open(bundle_path, "rb") as f:
+            bundle_data = orjson.loads(f.read())
         
         return self.load_bundle(bundle_data)
     
+    def _stream_bundle_file(self, bundle_path: Path) -> dict:
+        """Load a large bundle file batch by batch without parsing it whole."""
+        stats = _empty_stats()
+        batch = []
+        
+        with open(bundle_path, "rb") as f:
+            for entry in ijson.items(f, "entry.item", use_float=True):
+                batch.append(entry)
+                if len(batch) >= STREAMING_BATCH_SIZE:
+                    _add_stats(stats, self._write_entries(batch))
+                    batch = []
+        
+        if batch:
+            _add_stats(stats, self._write_entries(batch))
+        
+        return stats
+    
     def load_bundle(self, bundle_data: dict) -> dict:
         """
         Load a FHIR Bundle into Neo4j.
         
+        The whole bundle is written in a single managed write transaction,
+        so it costs one commit instead of one per statement.
+        
         Args:
             bundle_data: Parsed FHIR Bundle dictionary
             
         Returns:
             Dictionary with counts of loaded resources
         """
-        bundle = Bundle.model_validate(bundle_data)
-        
-        stats = {
-            "patients": 0,
-            "conditions": 0,
-            "medications": 0,
-            "body_systems": 0
-        }
+        if self.validate:
+            from fhir.resources.bundle import Bundle
+            Bundle.model_validate(bundle_data)
         
-        if not bundle.entry:
-            return stats
+        entries = bundle_data.get("entry")
+        if not entries:
+            return _empty_stats()
         
-        with self.driver.session() as session:
-            for entry in bundle.entry:
-                if not entry.resource:
-                    continue
-                    
-                resource = entry.resource
-                resource_type = resource.resource_type
-                
-                if resource_type == "Patient":
-                    self._create_patient(session, resource)
-                    stats["patients"] += 1
-                elif resource_type == "Condition":
-                    self._create_condition(session, resource)
-                    stats["conditions"] += 1
-                elif resource_type == "MedicationRequest":
-                    self._create_medication(session, resource)
-                    stats["medications"] += 1
+        return self._write_entries(entries)
+    
+    def _write_entries(self, entries: list) -> dict:
+        """Write a list of bundle entries in one transaction."""
+        with self.driver.session(database=self.database) as session:
+            stats, created = session.execute_write(self._load_entries, entries)
         
+        # Only remember body systems once their transaction has committed
+        self._body_systems_created.update(created)
         return stats
     
-    def _create_patient(self, session, patient: Patient):
-        """Create a Patient node in Neo4j."""
-        query = """
-        MERGE (p:Patient {id: $id})
-        SET p.name = $name,
-            p.birthDate = $birthDate,
-            p.gender = $gender
+    def _load_entries(self, tx, entries: list) -> tuple[dict, list[str]]:
+        """
+        Write bundle entries inside a transaction.
+        
+        Resources are collected into parameter rows per resource type and
+        written with one UNWIND query per type instead of one query per resource.
+        
+        Returns:
+            Stats for the bundle and the names of newly merged body systems
         """
+        stats = _empty_stats()
         
+        patients = []
+        conditions = []
+        medications = []
+        
+        for entry in entries:
+            resource = entry.get("resource")
+            if not resource:
+                continue
+                
+            resource_type = resource.get("resourceType")
+            
+            if resource_type == "Patient":
+                patients.append(self._build_patient_row(resource))
+                stats["patients"] += 1
+            elif resource_type == "Condition":
+                row = self._build_condition_row(resource)
+                if row:
+                    conditions.append(row)
+                stats["conditions"] += 1
+            elif resource_type == "MedicationRequest":
+                row = self._build_medication_row(resource)
+                if row:
+                    medications.append(row)
+                stats["medications"] += 1
+        
+        new_body_systems = {}
+        for row in conditions:
+            body_system = row["body_system"]
+            if body_system and body_system["name"] not in self._body_systems_created:
+                new_body_systems.setdefault(body_system["name"], body_system["description"])
+        for row in medications:
+            target = row["target"]
+            if target and target["name"] not in self._body_systems_created:
+                new_body_systems.setdefault(target["name"], None)
+        
+        if new_body_systems:
+            tx.run(_Q_BODY_SYSTEMS, rows=[
+                {"name": name, "description": description}
+                for name, description in new_body_systems.items()
+            ])
+        stats["body_systems"] = len(new_body_systems)
+        
+        # Patients first so conditions/medications can MATCH them
+        if patients:
+            tx.run(_Q_PATIENTS, rows=patients)
+        
+        if conditions:
+            tx.run(_Q_CONDITIONS, rows=conditions)
+        
+        if medications:
+            tx.run(_Q_MEDICATIONS, rows=medications)
+        
+        return stats, list(new_body_systems)
+    
+    def _build_patient_row(self, patient: dict) -> dict:
+        """Build the UNWIND parameter row for a Patient node."""
         # Extract name
         name = "Unknown"
-        if patient.name and len(patient.name) > 0:
-            name_obj = patient.name[0]
-            given = name_obj.given[0] if name_obj.given else ""
-            family = name_obj.family or ""
+        name_obj = _get(patient, "name", 0)
+        if name_obj:
+            given = _get(name_obj, "given", 0) or ""
+            family = name_obj.get("family") or ""
             name = f"{given} {family}".strip()
         
-        session.run(query,
-            id=patient.id,
-            name=name,
-            birthDate=str(patient.birthDate) if patient.birthDate else None,
-            gender=patient.gender
-        )
+        return {
+            "id": patient.get("id"),
+            "name": name,
+            "birthDate": patient.get("birthDate"),
+            "gender": patient.get("gender")
+        }
     
-    def _create_condition(self, session, condition: Condition):
-        """Create a Condition node and link to Patient and BodySystem."""
-        if not condition.code or not condition.code.coding:
-            return
+    def _build_condition_row(self, condition: dict) -> Optional[dict]:
+        """Build the UNWIND parameter row for a Condition and its BodySystem link."""
+        coding = _get(condition, "code", "coding", 0)
+        if not coding or not coding.get("code"):
+            return None
         
-        coding = condition.code.coding[0]
+        code = coding["code"]
         
-        # Get patient reference
-        patient_ref = None
-        if condition.subject and condition.subject.reference:
-            patient_ref = condition.subject.reference.split("/")[-1]
+        # Get patient reference ("Patient/<id>" -> "<id>")
+        reference = _get(condition, "subject", "reference") or ""
+        patient_ref = reference.rpartition("/")[2]
         
         if not patient_ref:
-            return
-        
-        # Create condition and link to patient
-        query = """
-        MATCH (p:Patient {id: $patient_id})
-        MERGE (c:Condition {code: $code})
-        SET c.display = $display,
-            c.system = $system
-        MERGE (p)-[:HAS_CONDITION {onsetDate: $onset}]->(c)
-        """
-        
-        onset = None
-        if condition.onsetDateTime:
-            onset = str(condition.onsetDateTime)
-        
-        session.run(query,
-            patient_id=patient_ref,
-            code=coding.code,
-            display=coding.display or coding.code,
-            system=coding.system,
-            onset=onset
-        )
+            return None
         
         # Link to body system if we have a mapping
-        body_system = CONDITION_TO_BODY_SYSTEM.get(coding.code[:3])  # Try category
+        body_system = CONDITION_TO_BODY_SYSTEM.get(code[:3])  # Try category
         if not body_system:
-            body_system = CONDITION_TO_BODY_SYSTEM.get(coding.code)  # Try exact
-        
-        if body_system:
-            self._link_condition_to_body_system(session, coding.code, body_system)
-    
-    def _link_condition_to_body_system(self, session, condition_code: str, body_system: dict):
-        """Create relationship between Condition and BodySystem."""
-        query = """
-        MATCH (c:Condition {code: $code})
-        MERGE (bs:BodySystem {name: $system_name})
-        ON CREATE SET bs.description = $description
-        MERGE (c)-[:AFFECTS {subsystem: $subsystem}]->(bs)
-        """
+            body_system = CONDITION_TO_BODY_SYSTEM.get(code)  # Try exact
         
-        session.run(query,
-            code=condition_code,
-            system_name=body_system["system"],
-            description=body_system.get("description", ""),
-            subsystem=body_system.get("subsystem", "")
-        )
+        return {
+            "patient_id": patient_ref,
+            "code": code,
+            "display": coding.get("display") or code,
+            "system": coding.get("system"),
+            "onset": condition.get("onsetDateTime"),
+            "body_system": {
+                "name": body_system["system"],
+                "description": body_system.get("description", ""),
+                "subsystem": body_system.get("subsystem", "")
+            } if body_system else None
+        }
     
-    def _create_medication(self, session, med_request: MedicationRequest):
-        """Create a Medication node and link to Patient."""
-        if not med_request.medicationCodeableConcept:
-            return
-        
-        if not med_request.medicationCodeableConcept.coding:
-            return
+    def _build_medication_row(self, med_request: dict) -> Optional[dict]:
+        """Build the UNWIND parameter row for a Medication and its BodySystem target."""
+        coding = _get(med_request, "medicationCodeableConcept", "coding", 0)
+        if not coding or not coding.get("code"):
+            return None
         
-        coding = med_request.medicationCodeableConcept.coding[0]
+        code = coding["code"]
         
-        # Get patient reference
-        patient_ref = None
-        if med_request.subject and med_request.subject.reference:
-            patient_ref = med_request.subject.reference.split("/")[-1]
+        # Get patient reference ("Patient/<id>" -> "<id>")
+        reference = _get(med_request, "subject", "reference") or ""
+        patient_ref = reference.rpartition("/")[2]
         
         if not patient_ref:
-            return
-        
-        # Create medication and link to patient
-        query = """
-        MATCH (p:Patient {id: $patient_id})
-        MERGE (m:Medication {code: $code})
-        SET m.display = $display,
-            m.system = $system
-        MERGE (p)-[:TAKES_MEDICATION]->(m)
-        """
-        
-        session.run(query,
-            patient_id=patient_ref,
-            code=coding.code,
-            display=coding.display or coding.code,
-            system=coding.system
-        )
+            return None
         
         # Link to body system target if we have a mapping
-        target = MEDICATION_TO_TARGET.get(coding.code)
-        if target:
-            self._link_medication_to_target(session, coding.code, target)
-    
-    def _link_medication_to_target(self, session, med_code: str, target: dict):
-        """Create relationship between Medication and BodySystem target."""
-        query = """
-        MATCH (m:Medication {code: $code})
-        MERGE (bs:BodySystem {name: $target_name})
-        MERGE (m)-[:TARGETS {action: $action}]->(bs)
-        """
+        target = MEDICATION_TO_TARGET.get(code)
         
-        session.run(query,
-            code=med_code,
-            target_name=target["target"],
-            action=target.get("action", "")
-        )
+        return {
+            "patient_id": patient_ref,
+            "code": code,
+            "display": coding.get("display") or code,
+            "system": coding.get("system"),
+            "target": {
+                "name": target["target"],
+                "action": target.get("action", "")
+            } if target else None
+        }
     
-    def load_directory(self, dir_path: Path) -> dict:
+    def load_directory(self, dir_path: Path, max_workers: int = 8) -> dict:
         """
         Load all FHIR Bundle JSON files from a directory.
         
+        Files are independent, so they are loaded concurrently; each worker
+        thread opens its own session from the shared (thread-safe) driver pool,
+        so reading/parsing one bundle overlaps with Cypher writes of another.
+        
         Args:
             dir_path: Path to directory containing FHIR JSON files
+            max_workers: Number of bundles loaded in parallel
             
         Returns:
             Aggregated stats from all loaded files
@@ -270,15 +471,29 @@ class FHIRToNeo4jLoader:
             "files_processed": 0
         }
         
-        for json_file in dir_path.glob("*.json"):
-            try:
-                stats = self.load_bundle_file(json_file)
-                for key in ["patients", "conditions", "medications"]:
-                    total_stats[key] += stats.get(key, 0)
-                total_stats["files_processed"] += 1
-                print(f"✅ Loaded {json_file.name}")
-            except Exception as e:
-                print(f"❌ Failed to load {json_file.name}: {e}")
+        # Largest bundles first so one big file doesn't start last and
+        # leave the other workers idle at the tail of the run
+        json_files = sorted(
+            dir_path.glob("*.json"), key=lambda path: path.stat().st_size, reverse=True
+        )
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.load_bundle_file, json_file): json_file
+                for json_file in json_files
+            }
+            
+            # Stats are only aggregated here, on the calling thread
+            for future in as_completed(futures):
+                json_file = futures[future]
+                try:
+                    stats = future.result()
+                    for key in ["patients", "conditions", "medications"]:
+                        total_stats[key] += stats.get(key, 0)
+                    total_stats["files_processed"] += 1
+                    logger.info("Loaded %s", json_file.name)
+                except Exception as e:
+                    logger.error("Failed to load %s: %s", json_file.name, e)
         
         return total_stats
 
@@ -286,21 +501,31 @@ class FHIRToNeo4jLoader:
 def main():
     """CLI for loading FHIR data."""
     import sys
+    from logging.handlers import MemoryHandler
+    
+    # Buffer per-file log lines instead of flushing stdout on every bundle;
+    # errors still flush immediately.
+    log_handler = MemoryHandler(1024, target=logging.StreamHandler(sys.stdout))
+    logging.basicConfig(level=logging.INFO, format="%(message)s", handlers=[log_handler])
+    
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    validate = "--validate" in sys.argv[1:]
     
-    if len(sys.argv) < 2:
-        print("Usage: python fhir_to_neo4j.py <path_to_fhir_bundles>")
+    if not args:
+        print("Usage: python fhir_to_neo4j.py <path_to_fhir_bundles> [--validate]")
         sys.exit(1)
     
-    data_path = Path(sys.argv[1])
+    data_path = Path(args[0])
     
     # Load from environment or use defaults
     import os
     uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
     user = os.getenv("NEO4J_USER", "neo4j")
     password = os.getenv("NEO4J_PASSWORD", "password")
+    database = os.getenv("NEO4J_DATABASE", "neo4j")
     
-    print(f"🔌 Connecting to Neo4j at {uri}...")
-    loader = FHIRToNeo4jLoader(uri, user, password)
+    logger.info("Connecting to Neo4j at %s...", uri)
+    loader = FHIRToNeo4jLoader(uri, user, password, validate=validate, database=database)
     
     try:
         if data_path.is_file():
@@ -308,12 +533,14 @@ def main():
         else:
             stats = loader.load_directory(data_path)
         
-        print("\n📊 Loading complete!")
-        print(f"   Patients: {stats.get('patients', 0)}")
-        print(f"   Conditions: {stats.get('conditions', 0)}")
-        print(f"   Medications: {stats.get('medications', 0)}")
+        logger.info("Loading complete!")
+        logger.info("   Patients: %d", stats.get("patients", 0))
+        logger.info("   Conditions: %d", stats.get("conditions", 0))
+        logger.info("   Medications: %d", stats.get("medications", 0))
     finally:
         loader.close()
+        shutdown_all()
+        log_handler.flush()
 
 
 if __name__ == "__main__":
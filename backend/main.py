@@ -6,14 +6,25 @@ Transforms EHR data into simple, visual health explanations using:
 - Claude AI for generating plain-language explanations
 - Wan 2.2 for educational video generation
 """
+import asyncio
+import logging
+import queue
+import re
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from neo4j import GraphDatabase
+from neo4j import AsyncGraphDatabase
+import orjson
 
 from config import get_settings
 from services.patient_service import PatientQueryService
@@ -21,6 +32,7 @@ from services.explanation_service import ExplanationService
 from services.video_service import VideoGenerationService
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 # Global service instances
 driver = None
@@ -28,46 +40,103 @@ patient_service: PatientQueryService = None
 explanation_service: ExplanationService = None
 video_service: VideoGenerationService = None
 
+# In-memory video generation jobs: job_id -> {"status", "video_url", "error", "finished_at"}
+video_jobs: dict[str, dict] = {}
+# Finished jobs are dropped this long after completing, so polling has time to see them
+VIDEO_JOB_TTL = 3600.0
+# Strong references so running background tasks aren't garbage collected
+_video_tasks: set[asyncio.Task] = set()
+# Submitted explanation batches: batch_id -> {"patient_ids", "video_job_ids", "expires_at"}.
+# patient_ids lists each item's patient by position; video_job_ids is filled
+# once the batch has ended and its video jobs have started
+explain_batches: dict[str, dict] = {}
+# Message Batch results can only be fetched for 29 days after creation
+BATCH_TTL = 29 * 24 * 3600.0
+
+# Created on startup; Patient.id is already indexed by the ETL's uniqueness constraint
+PATIENT_NAME_INDEX = (
+    "CREATE RANGE INDEX patient_name_idx IF NOT EXISTS FOR (p:Patient) ON (p.name)"
+)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifecycle - startup and shutdown."""
     global driver, patient_service, explanation_service, video_service
     
+    # Log records are queued and written to stdout by a background thread,
+    # so request handlers never block on console I/O
+    log_queue = queue.SimpleQueue()
+    log_handler = QueueHandler(log_queue)
+    log_listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    root_logger = logging.getLogger()
+    root_logger.addHandler(log_handler)
+    root_logger.setLevel(logging.INFO)
+    log_listener.start()
+    
     # Startup: Initialize services
-    print("🚀 Starting EHR Data Explainer...")
+    logger.info("🚀 Starting EHR Data Explainer...")
     
-    driver = GraphDatabase.driver(
+    # One bounded pool for all offloaded work (Gradio calls, file moves, to_thread)
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=settings.thread_pool_size, thread_name_prefix="worker")
+    )
+    
+    driver = AsyncGraphDatabase.driver(
         settings.neo4j_uri,
-        auth=(settings.neo4j_user, settings.neo4j_password)
+        auth=(settings.neo4j_user, settings.neo4j_password),
+        max_connection_pool_size=settings.neo4j_max_connection_pool_size,
+        connection_acquisition_timeout=settings.neo4j_connection_acquisition_timeout,
+        max_connection_lifetime=settings.neo4j_max_connection_lifetime,
+        keep_alive=True
     )
     
     # Verify Neo4j connection
     try:
-        driver.verify_connectivity()
-        print("✅ Connected to Neo4j")
+        await driver.verify_connectivity()
+        logger.info("✅ Connected to Neo4j")
     except Exception as e:
-        print(f"⚠️ Neo4j connection failed: {e}")
+        logger.warning("⚠️ Neo4j connection failed: %s", e)
     
-    patient_service = PatientQueryService(driver)
+    # Index patient names so the patient list can ORDER BY without a scan
+    try:
+        async with driver.session(database=settings.neo4j_database) as session:
+            await session.run(PATIENT_NAME_INDEX)
+    except Exception as e:
+        logger.warning("⚠️ Could not create Patient name index: %s", e)
+    
+    patient_service = PatientQueryService(driver, settings.neo4j_database)
     explanation_service = ExplanationService(settings.anthropic_api_key, settings.claude_model)
     video_service = VideoGenerationService(settings.hf_token)
     
-    print("✅ All services initialized")
+    logger.info("✅ All services initialized")
     
     yield
     
     # Shutdown: Cleanup
-    print("👋 Shutting down...")
+    logger.info("👋 Shutting down...")
+    if video_service:
+        await video_service.close()
     if driver:
-        driver.close()
+        await driver.close()
+    
+    log_listener.stop()
+    root_logger.removeHandler(log_handler)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, which is several times faster than json."""
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
 
 
 app = FastAPI(
     title="EHR Data Explainer",
     description="Transform EHR data into visual health explanations",
     version="0.1.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -98,15 +167,34 @@ class ExplainRequest(BaseModel):
     generate_video: bool = True
 
 
+class BatchExplainRequest(BaseModel):
+    """Request model for batch health explanation generation."""
+    items: list[ExplainRequest]
+
+
 class ExplainResponse(BaseModel):
     """Response model for health explanation."""
     patient_name: str
     explanation: dict
     video_prompt: str | None = None
     video_url: str | None = None
+    video_job_id: str | None = None
     graph_data: dict
 
 
+# FHIR resource ids: letters, digits, '-' and '.', at most 64 characters
+PATIENT_ID_PATTERN = re.compile(r"[A-Za-z0-9\-.]{1,64}")
+
+PATIENT_GRAPH_CYPHER = """
+MATCH (p:Patient {id: $patient_id})
+OPTIONAL MATCH (p)-[r1]-(connected)
+OPTIONAL MATCH (connected)-[r2]-(secondary)
+WHERE NOT secondary:Patient
+RETURN p, r1, connected, r2, secondary
+LIMIT 100
+"""
+
+
 # ============== API Endpoints ==============
 
 @app.get("/health")
@@ -114,7 +202,7 @@ async def health_check():
     """Health check endpoint."""
     neo4j_status = "connected"
     try:
-        driver.verify_connectivity()
+        await driver.verify_connectivity()
     except:
         neo4j_status = "disconnected"
     
@@ -129,7 +217,7 @@ async def health_check():
 async def list_patients(limit: int = 50):
     """Get list of all patients for the selector UI."""
     try:
-        patients = patient_service.get_all_patients(limit)
+        patients = await patient_service.get_all_patients(limit)
         return patients
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -139,7 +227,7 @@ async def list_patients(limit: int = 50):
 async def get_patient(patient_id: str):
     """Get detailed health summary for a specific patient."""
     try:
-        summary = patient_service.get_patient_health_summary(patient_id)
+        summary = await patient_service.get_patient_health_summary(patient_id)
         return summary.model_dump()
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Patient not found: {e}")
@@ -149,17 +237,17 @@ async def get_patient(patient_id: str):
 async def get_patient_graph(patient_id: str):
     """
     Get Cypher query for Neovis.js graph visualization.
-    The frontend will execute this query directly against Neo4j.
-    """
-    cypher = f"""
-    MATCH (p:Patient {{id: '{patient_id}'}})
-    OPTIONAL MATCH (p)-[r1]-(connected)
-    OPTIONAL MATCH (connected)-[r2]-(secondary)
-    WHERE NOT secondary:Patient
-    RETURN p, r1, connected, r2, secondary
-    LIMIT 100
+    The frontend will execute this query directly against Neo4j,
+    binding the returned params.
     """
-    return {"cypher": cypher, "patient_id": patient_id}
+    if not PATIENT_ID_PATTERN.fullmatch(patient_id):
+        raise HTTPException(status_code=400, detail="Invalid patient id")
+    
+    return {
+        "cypher": PATIENT_GRAPH_CYPHER,
+        "params": {"patient_id": patient_id},
+        "patient_id": patient_id
+    }
 
 
 @app.post("/api/explain", response_model=ExplainResponse)
@@ -170,52 +258,55 @@ async def explain_health(request: ExplainRequest):
     This endpoint:
     1. Fetches patient data from Neo4j graph
     2. Generates plain-language explanation via Claude
-    3. Optionally generates an educational video via Wan 2.2
+    3. Optionally starts an educational video via Wan 2.2 in the background;
+       poll `/api/videos/{video_job_id}` for its status
     """
     # Get patient data from graph
     try:
-        summary = patient_service.get_patient_health_summary(request.patient_id)
+        summary = await patient_service.get_patient_health_summary(request.patient_id)
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Patient not found: {e}")
     
     if not summary.conditions:
         raise HTTPException(status_code=400, detail="No conditions found for patient")
     
-    # Generate explanation with Claude
-    try:
-        explanation = await explanation_service.generate_health_explanation(
-            summary,
-            request.reading_level
+    # Generate explanation and video prompt with Claude concurrently;
+    # the video prompt only needs the summary
+    explanation_task = asyncio.create_task(
+        explanation_service.generate_health_explanation(summary, request.reading_level)
+    )
+    video_prompt_task = None
+    if request.generate_video:
+        video_prompt_task = asyncio.create_task(
+            explanation_service.generate_video_prompt(summary)
         )
+    
+    try:
+        explanation = await explanation_task
     except Exception as e:
+        if video_prompt_task:
+            video_prompt_task.cancel()
         raise HTTPException(status_code=500, detail=f"Failed to generate explanation: {e}")
     
     video_prompt = None
-    video_url = None
+    video_job_id = None
     
-    if request.generate_video:
-        # Generate video prompt
+    if video_prompt_task:
         try:
-            video_prompt = await explanation_service.generate_video_prompt(summary, explanation)
+            video_prompt = await video_prompt_task
         except Exception as e:
-            print(f"Warning: Failed to generate video prompt: {e}")
+            logger.warning("Failed to generate video prompt: %s", e)
         
-        # Generate video with Wan 2.2
+        # Generate video with Wan 2.2 without holding up the explanation
         if video_prompt:
-            try:
-                print(f"🎬 Starting video generation...")
-                result = await video_service.generate_video(video_prompt, request.patient_id)
-                video_url = f"/videos/{Path(result['video_path']).name}"
-                print(f"✅ Video ready: {video_url}")
-            except Exception as e:
-                print(f"❌ Video generation failed: {e}")
-                video_url = None
+            video_job_id = _start_video_job(video_prompt, request.patient_id)
     
     return ExplainResponse(
         patient_name=summary.patient_name,
         explanation=explanation,
         video_prompt=video_prompt,
-        video_url=video_url,
+        video_url=None,
+        video_job_id=video_job_id,
         graph_data={
             "conditions": summary.conditions,
             "medications": summary.medications,
@@ -224,6 +315,186 @@ async def explain_health(request: ExplainRequest):
     )
 
 
+def _start_video_job(prompt: str, patient_id: str) -> str:
+    """Run video generation as a background task and return its job id."""
+    _prune_video_jobs()
+    job_id = uuid.uuid4().hex
+    video_jobs[job_id] = {
+        "status": "pending", "video_url": None, "error": None, "finished_at": None
+    }
+    
+    task = asyncio.create_task(_run_video_job(job_id, prompt, patient_id))
+    _video_tasks.add(task)
+    task.add_done_callback(_video_tasks.discard)
+    return job_id
+
+
+def _prune_video_jobs():
+    """Drop jobs that finished more than VIDEO_JOB_TTL seconds ago."""
+    cutoff = time.monotonic() - VIDEO_JOB_TTL
+    expired = [
+        job_id for job_id, job in video_jobs.items()
+        if job["finished_at"] is not None and job["finished_at"] < cutoff
+    ]
+    for job_id in expired:
+        del video_jobs[job_id]
+
+
+async def _run_video_job(job_id: str, prompt: str, patient_id: str):
+    """Generate a video and record the outcome on its job."""
+    try:
+        logger.info("🎬 Starting video generation...")
+        result = await video_service.generate_video(prompt, patient_id)
+        video_url = f"/videos/{Path(result['video_path']).name}"
+        video_jobs[job_id].update(
+            status="done", video_url=video_url, finished_at=time.monotonic()
+        )
+        logger.info("✅ Video ready: %s", video_url)
+    except Exception as e:
+        logger.error("❌ Video generation failed: %s", e)
+        video_jobs[job_id].update(
+            status="error", error=str(e), finished_at=time.monotonic()
+        )
+
+
+@app.get("/api/videos/{job_id}")
+async def get_video_job(job_id: str):
+    """Get the status of a background video generation job."""
+    job = video_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "video_url": job["video_url"],
+        "error": job["error"]
+    }
+
+
+@app.post("/api/explain/stream")
+async def explain_health_stream(request: ExplainRequest):
+    """
+    Stream a personalized health explanation as Server-Sent Events.
+    
+    Each `data:` event carries a `{"text": ...}` chunk of the JSON explanation
+    as Claude generates it; a final `done` event (or `error`) closes the stream.
+    Video generation is not part of the streaming flow.
+    """
+    try:
+        summary = await patient_service.get_patient_health_summary(request.patient_id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Patient not found: {e}")
+    
+    if not summary.conditions:
+        raise HTTPException(status_code=400, detail="No conditions found for patient")
+    
+    async def events():
+        try:
+            async for chunk in explanation_service.stream_health_explanation(
+                summary,
+                request.reading_level
+            ):
+                yield f"data: {orjson.dumps({'text': chunk}).decode()}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {orjson.dumps({'detail': str(e)}).decode()}\n\n"
+            return
+        yield "event: done\ndata: {}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/api/explain/batch")
+async def explain_health_batch(request: BatchExplainRequest):
+    """
+    Submit explanations for many patients through Claude's Message Batches API.
+    
+    For non-interactive work such as preparing patient education overnight.
+    Batches cost half as much but may take up to 24 hours; poll
+    `/api/explain/batch/{batch_id}` for the results.
+    """
+    # One request per patient; a repeated id would duplicate batch custom_ids
+    items: dict[str, ExplainRequest] = {}
+    for item in request.items:
+        items.setdefault(item.patient_id, item)
+    
+    summaries = await asyncio.gather(
+        *(patient_service.get_patient_health_summary(patient_id) for patient_id in items),
+        return_exceptions=True
+    )
+    
+    batch_items = []
+    skipped = {}
+    for item, summary in zip(items.values(), summaries):
+        if isinstance(summary, Exception):
+            skipped[item.patient_id] = f"Patient not found: {summary}"
+        elif not summary.conditions:
+            skipped[item.patient_id] = "No conditions found for patient"
+        else:
+            batch_items.append((summary, item.reading_level, item.generate_video))
+    
+    if not batch_items:
+        raise HTTPException(status_code=400, detail={"skipped": skipped})
+    
+    try:
+        batch_id = await explanation_service.submit_batch(batch_items)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to submit batch: {e}")
+    
+    _prune_explain_batches()
+    explain_batches[batch_id] = {
+        "patient_ids": [summary.patient_id for summary, _, _ in batch_items],
+        "video_job_ids": None,
+        "expires_at": time.monotonic() + BATCH_TTL
+    }
+    return {"batch_id": batch_id, "submitted": len(batch_items), "skipped": skipped}
+
+
+@app.get("/api/explain/batch/{batch_id}")
+async def get_explain_batch(batch_id: str):
+    """
+    Get the status of an explanation batch.
+    
+    Once the batch has ended, returns each patient's explanation and starts
+    their video jobs (once per batch); poll `/api/videos/{video_job_id}`.
+    """
+    entry = explain_batches.get(batch_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    try:
+        batch = await explanation_service.get_batch_results(batch_id, entry["patient_ids"])
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Batch not found: {e}")
+    
+    results = batch["results"]
+    if results is None:
+        return {"batch_id": batch_id, "status": batch["status"], "results": None}
+    
+    job_ids = entry["video_job_ids"]
+    if job_ids is None:
+        job_ids = entry["video_job_ids"] = {
+            patient_id: _start_video_job(result["video_prompt"], patient_id)
+            for patient_id, result in results.items()
+            if result["video_prompt"]
+        }
+    
+    for patient_id, result in results.items():
+        result["video_job_id"] = job_ids.get(patient_id)
+    
+    return {"batch_id": batch_id, "status": batch["status"], "results": results}
+
+
+def _prune_explain_batches():
+    """Drop batches whose results can no longer be fetched."""
+    now = time.monotonic()
+    expired = [
+        batch_id for batch_id, entry in explain_batches.items()
+        if entry["expires_at"] < now
+    ]
+    for batch_id in expired:
+        del explain_batches[batch_id]
+
+
 @app.get("/api/body-systems")
 async def get_body_systems():
     """Get all body systems in the knowledge graph."""
@@ -232,9 +503,9 @@ async def get_body_systems():
     RETURN bs.name as name, bs.description as description
     ORDER BY bs.name
     """
-    with driver.session() as session:
-        results = session.run(query)
-        return [dict(r) for r in results]
+    async with driver.session(database=settings.neo4j_database) as session:
+        results = await session.run(query)
+        return [dict(r) async for r in results]
 
 
 if __name__ == "__main__":
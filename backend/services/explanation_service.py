@@ -6,9 +6,78 @@ Uses Anthropic's Claude API with optional Healthcare connectors for:
 - PubMed evidence-based information
 - FHIR resource handling
 """
+import hashlib
 import json
+import logging
+import time
+from typing import AsyncIterator
+
 import anthropic
+import orjson
 from .patient_service import PatientHealthSummary
+from .single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Static instructions are sent as a cached system block; only the
+# patient-specific data varies between requests.
+EXPLANATION_INSTRUCTIONS = """You are a caring health educator explaining a patient's health situation 
+in simple, reassuring terms. Use analogies and everyday language.
+
+You will be given a patient's conditions, medications, affected body systems,
+how the conditions relate, and a target reading level.
+
+Please create a warm, educational explanation at the requested reading level that:
+1. Explains what's happening in their body (use simple anatomical terms)
+2. Why each medication helps
+3. How their conditions connect to each other
+4. Reassuring tone - focus on what IS working and how treatment helps
+
+IMPORTANT: Include appropriate medical context but keep language accessible.
+Always remind the patient to discuss questions with their healthcare provider.
+
+Format the response as valid JSON:
+{
+    "greeting": "A warm opening addressing the patient by name",
+    "body_explanation": "What's happening inside their body (2-3 paragraphs)",
+    "medication_explanation": "How their medications help (explain each one simply)",
+    "connections": "How their conditions relate to each other",
+    "encouragement": "Positive, supportive closing message",
+    "key_takeaways": ["3-4 simple bullet points to remember"]
+}
+
+Return ONLY the JSON, no other text."""
+
+VIDEO_PROMPT_INSTRUCTIONS = """Create a prompt for an AI video generator to make a calming medical educational animation.
+
+You will be given the patient's main conditions and primary body system.
+
+Write a detailed video generation prompt (under 200 words) that describes:
+1. Visual style: Soft, medical illustration aesthetic with calming colors (blues, greens, soft whites)
+2. Anatomical focus: The primary body system and related systems
+3. Animation sequence: Show how the condition affects the body, then how treatment helps
+4. Mood: Reassuring, educational, hopeful
+
+DO NOT include text overlays or narration - just visual description.
+Focus on ONE key concept to illustrate clearly.
+
+Example format:
+"Soft medical animation showing [specific anatomy]. Gentle [color] palette. The animation reveals [what happens], then shows [how treatment helps]. Calming, reassuring visual style suitable for patient education."
+
+Write ONLY the video prompt, nothing else."""
+
+# custom_id prefixes for Message Batch requests: "<kind>-<item index>". The
+# API only accepts [a-zA-Z0-9_-]{1,64}, which FHIR patient ids don't always fit
+BATCH_EXPLANATION = "e"
+BATCH_VIDEO_PROMPT = "v"
+
+# (summary, reading_level, generate_video) for submit_batch()
+BatchItem = tuple[PatientHealthSummary, str, bool]
+
+
+def _cached_system(instructions: str) -> list[dict]:
+    """System block marked for Anthropic prompt caching."""
+    return [{"type": "text", "text": instructions, "cache_control": {"type": "ephemeral"}}]
 
 
 class ExplanationService:
@@ -22,9 +91,55 @@ class ExplanationService:
     - CMS coverage database for treatment context
     """
     
-    def __init__(self, api_key: str, model: str = "claude-sonnet-4-20250514"):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "claude-sonnet-4-20250514",
+        cache_ttl: float = 3600.0,
+        cache_size: int = 512
+    ):
+        # One async client for every Claude call, so requests share its
+        # connection pool and never block the event loop
+        self.client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            max_retries=2,
+            timeout=anthropic.Timeout(60.0, connect=5.0)
+        )
         self.model = model
+        
+        # Completed Claude results keyed by a hash of their inputs: key -> (expires_at, value)
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache: dict[str, tuple[float, object]] = {}
+        # Concurrent cache misses for the same key share one Claude call
+        self._inflight = SingleFlight()
+    
+    def _cache_key(self, kind: str, summary: PatientHealthSummary, *extra: str) -> str:
+        """Hash everything that shapes a Claude response into a cache key."""
+        digest = hashlib.blake2b(digest_size=16)
+        summary_json = orjson.dumps(summary.model_dump(), option=orjson.OPT_SORT_KEYS, default=str)
+        for part in (kind.encode(), self.model.encode(), summary_json, *(e.encode() for e in extra)):
+            digest.update(part)
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def _cache_get(self, key: str):
+        """Return a cached value if it hasn't expired, else None."""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        return value
+    
+    def _cache_set(self, key: str, value):
+        """Store a value, evicting the oldest entry when full."""
+        self._cache.pop(key, None)
+        if len(self._cache) >= self.cache_size:
+            del self._cache[next(iter(self._cache))]
+        self._cache[key] = (time.monotonic() + self.cache_ttl, value)
     
     async def generate_health_explanation(
         self,
@@ -34,6 +149,9 @@ class ExplanationService:
         """
         Generate a patient-friendly explanation of their health situation.
         
+        Concurrent requests for the same summary and reading level share a
+        single Claude call.
+        
         Args:
             summary: Patient health data from Neo4j
             reading_level: Target reading level for explanation
@@ -41,66 +159,37 @@ class ExplanationService:
         Returns:
             Dictionary with structured explanation sections
         """
-        prompt = f"""You are a caring health educator explaining a patient's health situation 
-in simple, reassuring terms. Use analogies and everyday language.
-
-Patient: {summary.patient_name}
-
-Their health conditions:
-{self._format_conditions(summary.conditions)}
-
-Their medications:
-{self._format_medications(summary.medications)}
-
-Body systems affected:
-{self._format_body_systems(summary.body_systems_affected)}
-
-How conditions relate to each other:
-{self._format_relationships(summary.condition_relationships)}
-
-Please create a warm, educational explanation at a {reading_level} reading level that:
-1. Explains what's happening in their body (use simple anatomical terms)
-2. Why each medication helps
-3. How their conditions connect to each other
-4. Reassuring tone - focus on what IS working and how treatment helps
-
-IMPORTANT: Include appropriate medical context but keep language accessible.
-Always remind the patient to discuss questions with their healthcare provider.
-
-Format the response as valid JSON:
-{{
-    "greeting": "A warm opening addressing the patient by name",
-    "body_explanation": "What's happening inside their body (2-3 paragraphs)",
-    "medication_explanation": "How their medications help (explain each one simply)",
-    "connections": "How their conditions relate to each other",
-    "encouragement": "Positive, supportive closing message",
-    "key_takeaways": ["3-4 simple bullet points to remember"]
-}}
-
-Return ONLY the JSON, no other text."""
-
+        cache_key = self._cache_key("explanation", summary, reading_level)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        return await self._inflight.run(
+            cache_key,
+            lambda: self._create_health_explanation(summary, reading_level, cache_key)
+        )
+    
+    async def _create_health_explanation(
+        self,
+        summary: PatientHealthSummary,
+        reading_level: str,
+        cache_key: str
+    ) -> dict:
+        """Ask Claude for an explanation and cache it if the answer parses."""
         try:
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=2000,
-                messages=[{"role": "user", "content": prompt}]
+            message = await self.client.messages.create(
+                **self._explanation_request(summary, reading_level)
             )
             
             response_text = message.content[0].text
         except Exception as e:
             # Return demo response if API fails (e.g., no credits)
-            print(f"Claude API error: {e}, using demo response")
+            logger.warning("Claude API error: %s, using demo response", e)
             return self._get_demo_response(summary)
         
         # Parse JSON from response
         try:
-            # Try to extract JSON if there's extra text
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0]
-            
-            return json.loads(response_text.strip())
+            explanation = self._parse_json_response(response_text)
         except json.JSONDecodeError:
             # Fallback structure if JSON parsing fails
             return {
@@ -115,6 +204,76 @@ Return ONLY the JSON, no other text."""
                     "Always ask your healthcare team questions"
                 ]
             }
+        
+        # Only real Claude answers are cached; demo/fallback responses are retried next time
+        self._cache_set(cache_key, explanation)
+        return explanation
+    
+    async def stream_health_explanation(
+        self,
+        summary: PatientHealthSummary,
+        reading_level: str = "6th grade"
+    ) -> AsyncIterator[str]:
+        """
+        Stream the raw explanation text from Claude as it is generated.
+        
+        Yields text chunks of the JSON explanation so the client can render
+        progress immediately. The completed response is parsed and cached like
+        generate_health_explanation; a cache hit is yielded as one chunk.
+        """
+        cache_key = self._cache_key("explanation", summary, reading_level)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield orjson.dumps(cached).decode()
+            return
+        
+        chunks = []
+        async with self.client.messages.stream(
+            **self._explanation_request(summary, reading_level)
+        ) as stream:
+            async for text in stream.text_stream:
+                chunks.append(text)
+                yield text
+        
+        try:
+            self._cache_set(cache_key, self._parse_json_response("".join(chunks)))
+        except json.JSONDecodeError:
+            pass
+    
+    def _parse_json_response(self, response_text: str) -> dict:
+        """Parse Claude's JSON answer, tolerating surrounding markdown fences."""
+        # Try to extract JSON if there's extra text
+        if "```json" in response_text:
+            response_text = response_text.split("```json")[1].split("```")[0]
+        elif "```" in response_text:
+            response_text = response_text.split("```")[1].split("```")[0]
+        
+        return orjson.loads(response_text.strip())
+    
+    def _explanation_request(self, summary: PatientHealthSummary, reading_level: str) -> dict:
+        """Build messages.create() arguments for a health explanation."""
+        patient_data = f"""Patient: {summary.patient_name}
+
+Their health conditions:
+{self._format_conditions(summary.conditions)}
+
+Their medications:
+{self._format_medications(summary.medications)}
+
+Body systems affected:
+{self._format_body_systems(summary.body_systems_affected)}
+
+How conditions relate to each other:
+{self._format_relationships(summary.condition_relationships)}
+
+Target reading level: {reading_level}"""
+        
+        return {
+            "model": self.model,
+            "max_tokens": 2000,
+            "system": _cached_system(EXPLANATION_INSTRUCTIONS),
+            "messages": [{"role": "user", "content": patient_data}]
+        }
     
     def _get_demo_response(self, summary: PatientHealthSummary) -> dict:
         """Generate a demo response when Claude API is unavailable."""
@@ -136,17 +295,37 @@ Return ONLY the JSON, no other text."""
             ]
         }
 
-    async def generate_video_prompt(
-        self,
-        summary: PatientHealthSummary,
-        explanation: dict
-    ) -> str:
+    async def generate_video_prompt(self, summary: PatientHealthSummary) -> str:
         """
         Generate a detailed prompt for Wan 2.2 video generation.
         
         Creates a visual description for an educational medical animation
-        that illustrates the patient's health situation.
+        that illustrates the patient's health situation. Only needs the
+        summary, so it can run concurrently with the explanation itself.
+        Concurrent requests for the same summary share a single Claude call.
         """
+        cache_key = self._cache_key("video_prompt", summary)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        return await self._inflight.run(
+            cache_key,
+            lambda: self._create_video_prompt(summary, cache_key)
+        )
+    
+    async def _create_video_prompt(self, summary: PatientHealthSummary, cache_key: str) -> str:
+        """Ask Claude for a video prompt and cache it."""
+        message = await self.client.messages.create(
+            **self._video_prompt_request(summary)
+        )
+        
+        video_prompt = message.content[0].text.strip()
+        self._cache_set(cache_key, video_prompt)
+        return video_prompt
+    
+    def _video_prompt_request(self, summary: PatientHealthSummary) -> dict:
+        """Build messages.create() arguments for a Wan 2.2 video prompt."""
         # Determine primary body system for visualization
         primary_system = "body"
         if summary.body_systems_affected:
@@ -154,33 +333,83 @@ Return ONLY the JSON, no other text."""
         
         conditions_list = [c.get("display", "") for c in summary.conditions[:3]]
         
-        prompt = f"""Create a prompt for an AI video generator to make a calming medical educational animation.
-
-Patient's main conditions: {', '.join(conditions_list)}
-Primary body system: {primary_system}
-Explanation context: {explanation.get('body_explanation', '')[:500]}
-
-Write a detailed video generation prompt (under 200 words) that describes:
-1. Visual style: Soft, medical illustration aesthetic with calming colors (blues, greens, soft whites)
-2. Anatomical focus: The {primary_system} and related systems
-3. Animation sequence: Show how the condition affects the body, then how treatment helps
-4. Mood: Reassuring, educational, hopeful
-
-DO NOT include text overlays or narration - just visual description.
-Focus on ONE key concept to illustrate clearly.
-
-Example format:
-"Soft medical animation showing [specific anatomy]. Gentle [color] palette. The animation reveals [what happens], then shows [how treatment helps]. Calming, reassuring visual style suitable for patient education."
-
-Write ONLY the video prompt, nothing else."""
-
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=400,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        patient_data = f"""Patient's main conditions: {', '.join(conditions_list)}
+Primary body system: {primary_system}"""
+        
+        return {
+            "model": self.model,
+            "max_tokens": 400,
+            "system": _cached_system(VIDEO_PROMPT_INSTRUCTIONS),
+            "messages": [{"role": "user", "content": patient_data}]
+        }
+    
+    async def submit_batch(self, items: list[BatchItem]) -> str:
+        """
+        Submit explanations (and video prompts) for many patients as one
+        Message Batch.
+        
+        Batches are billed at half the normal rate and don't count against
+        the real-time rate limits, which suits bulk and overnight work.
+        
+        Items must be for distinct patients; results are matched back by
+        their position in items.
+        
+        Returns:
+            The Anthropic batch id, for get_batch_results()
+        """
+        requests = []
+        for index, (summary, reading_level, with_video) in enumerate(items):
+            requests.append({
+                "custom_id": f"{BATCH_EXPLANATION}-{index}",
+                "params": self._explanation_request(summary, reading_level)
+            })
+            if with_video:
+                requests.append({
+                    "custom_id": f"{BATCH_VIDEO_PROMPT}-{index}",
+                    "params": self._video_prompt_request(summary)
+                })
+        
+        batch = await self.client.messages.batches.create(requests=requests)
+        return batch.id
+    
+    async def get_batch_results(self, batch_id: str, patient_ids: list[str]) -> dict:
+        """
+        Check a Message Batch and collect its results once it has ended.
+        
+        Args:
+            batch_id: Id returned by submit_batch()
+            patient_ids: Patient id of each submitted item, in submission order
+        
+        Returns:
+            Dictionary with the batch status and, once ended, a results dict
+            of patient_id -> {"explanation", "video_prompt", "error"}
+        """
+        batch = await self.client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            return {"status": batch.processing_status, "results": None}
+        
+        results: dict[str, dict] = {}
+        async for entry in await self.client.messages.batches.results(batch_id):
+            kind, _, index = entry.custom_id.partition("-")
+            patient_id = patient_ids[int(index)]
+            item = results.setdefault(
+                patient_id, {"explanation": None, "video_prompt": None, "error": None}
+            )
+            
+            if entry.result.type != "succeeded":
+                item["error"] = f"{kind} request {entry.result.type}"
+                continue
+            
+            response_text = entry.result.message.content[0].text
+            if kind == BATCH_VIDEO_PROMPT:
+                item["video_prompt"] = response_text.strip()
+                continue
+            try:
+                item["explanation"] = self._parse_json_response(response_text)
+            except json.JSONDecodeError:
+                item["error"] = "explanation was not valid JSON"
         
-        return message.content[0].text.strip()
+        return {"status": batch.processing_status, "results": results}
     
     def _format_conditions(self, conditions: list[dict]) -> str:
         """Format conditions list for prompt."""
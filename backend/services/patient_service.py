@@ -1,9 +1,13 @@
 """
 Patient Query Service - Neo4j graph queries for patient health data.
 """
-from neo4j import GraphDatabase
+import time
+
+from neo4j import AsyncDriver
 from pydantic import BaseModel
 
+from .single_flight import SingleFlight
+
 
 class PatientHealthSummary(BaseModel):
     """Structured summary of a patient's health data from the graph."""
@@ -16,58 +20,126 @@ class PatientHealthSummary(BaseModel):
 
 
 class PatientQueryService:
-    """Service for querying patient data from Neo4j knowledge graph."""
+    """
+    Service for querying patient data from Neo4j knowledge graph.
+    
+    Uses the async driver so queries don't block the FastAPI event loop.
+    """
     
-    def __init__(self, driver: GraphDatabase.driver):
+    def __init__(
+        self,
+        driver: AsyncDriver,
+        database: str = "neo4j",
+        cache_ttl: float = 60.0,
+        cache_size: int = 1024
+    ):
         self.driver = driver
+        self.database = database
+        
+        # Short-lived summary cache: patient_id -> (expires_at, summary)
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._summary_cache: dict[str, tuple[float, PatientHealthSummary]] = {}
+        # Concurrent misses for one patient share a single query
+        self._summary_inflight = SingleFlight()
+    
+    def _cached_summary(self, patient_id: str) -> PatientHealthSummary | None:
+        """Return a cached summary if it hasn't expired, else None."""
+        entry = self._summary_cache.get(patient_id)
+        if entry is None:
+            return None
+        expires_at, summary = entry
+        if expires_at < time.monotonic():
+            del self._summary_cache[patient_id]
+            return None
+        return summary
     
-    def get_patient_health_summary(self, patient_id: str) -> PatientHealthSummary:
+    async def get_patient_health_summary(self, patient_id: str) -> PatientHealthSummary:
         """
         Get comprehensive health summary for explanation generation.
         
         Returns patient's conditions, medications, affected body systems,
-        and relationships between conditions.
+        and relationships between conditions. Summaries are cached for
+        cache_ttl seconds.
         """
+        summary = self._cached_summary(patient_id)
+        if summary is not None:
+            return summary
+        
+        return await self._summary_inflight.run(
+            patient_id, lambda: self._load_health_summary(patient_id)
+        )
+    
+    async def _load_health_summary(self, patient_id: str) -> PatientHealthSummary:
+        """Fetch a summary and cache it before the in-flight call completes."""
+        summary = await self._fetch_health_summary(patient_id)
+        if len(self._summary_cache) >= self.cache_size:
+            del self._summary_cache[next(iter(self._summary_cache))]
+        self._summary_cache[patient_id] = (time.monotonic() + self.cache_ttl, summary)
+        return summary
+    
+    async def _fetch_health_summary(self, patient_id: str) -> PatientHealthSummary:
+        """Query the graph for a patient's health summary."""
+        # Each CALL subquery collects one branch of the graph on its own,
+        # so conditions x medications x body systems never cross-multiply
         query = """
         MATCH (p:Patient {id: $patient_id})
-        OPTIONAL MATCH (p)-[:HAS_CONDITION]->(c:Condition)
-        OPTIONAL MATCH (c)-[:AFFECTS]->(bs:BodySystem)
-        OPTIONAL MATCH (p)-[:TAKES_MEDICATION]->(m:Medication)
-        OPTIONAL MATCH (m)-[:TREATS]->(tc:Condition)
-        
+        CALL {
+            WITH p
+            OPTIONAL MATCH (p)-[hc:HAS_CONDITION]->(c:Condition)
+            OPTIONAL MATCH (c)-[:RELATED_TO]->(rc:Condition)
+            RETURN collect(DISTINCT {
+                       code: c.code,
+                       display: c.display,
+                       onset: coalesce(hc.onsetDate, c.onsetDate)
+                   }) as conditions,
+                   collect(DISTINCT {
+                       condition: c.display,
+                       related_to: rc.display
+                   }) as relationships
+        }
+        CALL {
+            WITH p
+            OPTIONAL MATCH (p)-[:TAKES_MEDICATION]->(m:Medication)
+            OPTIONAL MATCH (m)-[:TREATS]->(tc:Condition)
+            RETURN collect(DISTINCT {
+                       code: m.code,
+                       display: m.display,
+                       treats: tc.display
+                   }) as medications
+        }
+        CALL {
+            WITH p
+            OPTIONAL MATCH (p)-[:HAS_CONDITION]->(:Condition)-[:AFFECTS]->(bs:BodySystem)
+            RETURN collect(DISTINCT {
+                       system: bs.name,
+                       description: bs.description
+                   }) as body_systems
+        }
         RETURN p.name as patient_name,
-               collect(DISTINCT {
-                   code: c.code, 
-                   display: c.display, 
-                   onset: c.onsetDate
-               }) as conditions,
-               collect(DISTINCT {
-                   code: m.code, 
-                   display: m.display,
-                   treats: tc.display
-               }) as medications,
-               collect(DISTINCT {
-                   system: bs.name,
-                   description: bs.description
-               }) as body_systems
+               conditions,
+               medications,
+               body_systems,
+               relationships
         """
         
-        with self.driver.session() as session:
-            result = session.run(query, patient_id=patient_id).single()
+        async with self.driver.session(database=self.database) as session:
+            result = await session.run(query, patient_id=patient_id)
+            record = await result.single()
             
-            if not result or not result["patient_name"]:
+            if not record or not record["patient_name"]:
                 raise ValueError(f"Patient {patient_id} not found")
             
             return PatientHealthSummary(
                 patient_id=patient_id,
-                patient_name=result["patient_name"] or "Unknown",
-                conditions=[c for c in result["conditions"] if c.get("code")],
-                medications=[m for m in result["medications"] if m.get("code")],
-                body_systems_affected=[bs for bs in result["body_systems"] if bs.get("system")],
-                condition_relationships=[]
+                patient_name=record["patient_name"] or "Unknown",
+                conditions=[c for c in record["conditions"] if c.get("code")],
+                medications=[m for m in record["medications"] if m.get("code")],
+                body_systems_affected=[bs for bs in record["body_systems"] if bs.get("system")],
+                condition_relationships=[r for r in record["relationships"] if r.get("related_to")]
             )
     
-    def get_all_patients(self, limit: int = 50) -> list[dict]:
+    async def get_all_patients(self, limit: int = 50) -> list[dict]:
         """Get list of all patients for selector UI."""
         query = """
         MATCH (p:Patient)
@@ -82,11 +154,11 @@ class PatientQueryService:
         LIMIT $limit
         """
         
-        with self.driver.session() as session:
-            results = session.run(query, limit=limit)
-            return [dict(r) for r in results]
+        async with self.driver.session(database=self.database) as session:
+            results = await session.run(query, limit=limit)
+            return [dict(r) async for r in results]
     
-    def get_patient_conditions(self, patient_id: str) -> list[dict]:
+    async def get_patient_conditions(self, patient_id: str) -> list[dict]:
         """Get detailed conditions for a patient."""
         query = """
         MATCH (p:Patient {id: $patient_id})-[hc:HAS_CONDITION]->(c:Condition)
@@ -98,11 +170,11 @@ class PatientQueryService:
                collect(bs.name) as body_systems
         """
         
-        with self.driver.session() as session:
-            results = session.run(query, patient_id=patient_id)
-            return [dict(r) for r in results]
+        async with self.driver.session(database=self.database) as session:
+            results = await session.run(query, patient_id=patient_id)
+            return [dict(r) async for r in results]
     
-    def get_patient_medications(self, patient_id: str) -> list[dict]:
+    async def get_patient_medications(self, patient_id: str) -> list[dict]:
         """Get detailed medications for a patient."""
         query = """
         MATCH (p:Patient {id: $patient_id})-[:TAKES_MEDICATION]->(m:Medication)
@@ -114,11 +186,11 @@ class PatientQueryService:
                collect(DISTINCT bs.name) as targets_body_systems
         """
         
-        with self.driver.session() as session:
-            results = session.run(query, patient_id=patient_id)
-            return [dict(r) for r in results]
+        async with self.driver.session(database=self.database) as session:
+            results = await session.run(query, patient_id=patient_id)
+            return [dict(r) async for r in results]
     
-    def search_patients(self, search_term: str, limit: int = 20) -> list[dict]:
+    async def search_patients(self, search_term: str, limit: int = 20) -> list[dict]:
         """Search patients by name."""
         query = """
         MATCH (p:Patient)
@@ -133,6 +205,6 @@ class PatientQueryService:
         LIMIT $limit
         """
         
-        with self.driver.session() as session:
-            results = session.run(query, search_term=search_term, limit=limit)
-            return [dict(r) for r in results]
+        async with self.driver.session(database=self.database) as session:
+            results = await session.run(query, search_term=search_term, limit=limit)
+            return [dict(r) async for r in results]
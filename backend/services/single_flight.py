@@ -0,0 +1,27 @@
+"""
+Single-flight coalescing for expensive async calls.
+
+Concurrent callers asking for the same key share one in-flight task
+instead of each starting their own Claude or Wan 2.2 request.
+"""
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers await the same result."""
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """Await the in-flight call for key, starting call() if there is none."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one caller disconnecting doesn't cancel the call for the others
+        return await asyncio.shield(task)
@@ -6,15 +6,74 @@ Uses Hugging Face Spaces Gradio API:
 """
 import asyncio
 import base64
+import hashlib
+import logging
+import os
+import random
+import shutil
+import threading
 import time
 from pathlib import Path
 from typing import Optional
-from concurrent.futures import ThreadPoolExecutor
 
-import aiofiles
+from .single_flight import SingleFlight
 
-# Thread pool for running sync gradio_client calls
-_executor = ThreadPoolExecutor(max_workers=2)
+logger = logging.getLogger(__name__)
+
+# Buffer for copying videos when the kernel can't do it with sendfile
+COPY_BUFFER_SIZE = 1 << 20
+
+# Retries for transient failures reaching the Space (cold start, dropped connection)
+MAX_ATTEMPTS = 5
+MAX_RETRY_DELAY = 30.0
+
+# Generation settings for the Space's /generate_video endpoint
+# (image, prompt, height, width, duration_seconds, sampling_steps, guide_scale, shift, seed).
+# ULTRA minimal settings to stay under ZeroGPU free tier quota!
+GENERATION_PARAMS = {
+    "height": 320,   # Very low resolution
+    "width": 576,    # 16:9 aspect ratio
+    "duration_seconds": 1.0,  # Minimum 1-second clip
+    "sampling_steps": 10,  # Absolute minimum steps
+    "guide_scale": 5.0,
+    "shift": 5.0,
+    "seed": -1,  # Random seed
+}
+
+# Ask Hugging Face to serve repeated identical requests from its cache
+CLIENT_HEADERS = {"X-use-cache": "true"}
+
+
+def _copy_video(src: str, dst: Path):
+    """Copy a video in the kernel with sendfile, or through a 1 MiB buffer."""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            size = os.fstat(fsrc.fileno()).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except (AttributeError, OSError):
+            # No sendfile for these files on this platform; start over in user space
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst, COPY_BUFFER_SIZE)
+
+
+def _read_base64(video_path: str) -> str:
+    """Read a video and base64-encode it, both off the event loop."""
+    return base64.b64encode(Path(video_path).read_bytes()).decode("ascii")
+
+
+def _transfer_video(src: str, dst: Path):
+    """Move the Space's output into place, copying only across filesystems."""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        _copy_video(src, dst)
 
 
 class VideoGenerationService:
@@ -32,32 +91,68 @@ class VideoGenerationService:
         # Setup output directory
         self.output_dir = Path(__file__).parent.parent / "generated_videos"
         self.output_dir.mkdir(exist_ok=True)
-    
-    def _generate_sync(self, prompt: str, duration: float = 2.0) -> str:
-        """Synchronous video generation using gradio_client."""
-        from gradio_client import Client, handle_file
         
-        # Connect to the Space
-        client = Client(self.space_id)
+        # Gradio client for the Space, created on first use and reused;
+        # the lock stops concurrent executor threads from each connecting
+        self._client = None
+        self._client_lock = threading.Lock()
+        
+        # Identical concurrent requests share one generation
+        self._inflight = SingleFlight()
+    
+    def _get_client(self):
+        """Return the shared Gradio client, connecting to the Space on first use."""
+        client = self._client
+        if client is None:
+            with self._client_lock:
+                client = self._client
+                if client is None:
+                    from gradio_client import Client
+                    
+                    client = self._client = Client(
+                        self.space_id,
+                        hf_token=self.hf_token or None,
+                        headers=CLIENT_HEADERS
+                    )
+        return client
+    
+    async def close(self):
+        """Release the shared Gradio client."""
+        client, self._client = self._client, None
+        if client is not None and hasattr(client, "close"):
+            await asyncio.to_thread(client.close)
+    
+    def _predict(self, prompt: str):
+        """Call the Space's generate_video endpoint."""
+        # Reuse the connection to the Space across generations
+        client = self._get_client()
         
-        # Call the generate_video function with correct parameters
-        # API: image, prompt, height, width, duration_seconds, sampling_steps, guide_scale, shift, seed
         # For text-to-video, we pass image as None/empty
-        # ULTRA minimal settings to stay under ZeroGPU free tier quota!
-        result = client.predict(
+        return client.predict(
             image=None,  # None for text-to-video mode
             prompt=prompt,
-            height=320,   # Very low resolution
-            width=576,    # 16:9 aspect ratio
-            duration_seconds=1.0,  # Minimum 1-second clip
-            sampling_steps=10,  # Absolute minimum steps
-            guide_scale=5.0,
-            shift=5.0,
-            seed=-1,  # Random seed
+            **GENERATION_PARAMS,
             api_name="/generate_video"
         )
+    
+    def _generate_sync(self, prompt: str, duration: float = 2.0) -> str:
+        """Synchronous video generation using gradio_client."""
+        import httpx
         
-        print(f"📹 Raw result: {result}")
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                result = self._predict(prompt)
+                break
+            except (httpx.TransportError, ConnectionError) as e:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                # Exponential backoff with jitter; reconnect in case the Space restarted
+                delay = min(2 ** attempt, MAX_RETRY_DELAY) + random.uniform(0, 1)
+                logger.warning("⚠️ Wan 2.2 Space unreachable (%s), retrying in %.1fs...", e, delay)
+                self._client = None
+                time.sleep(delay)
+        
+        logger.debug("📹 Raw result: %s", result)
         
         # Result is a dict with 'video' key containing the file path
         if isinstance(result, dict):
@@ -67,62 +162,110 @@ class VideoGenerationService:
             return str(result)
         return result  # Returns path to generated video
     
+    @staticmethod
+    def _video_cache_key(prompt: str) -> str:
+        """Hash the prompt together with the generation settings."""
+        digest = hashlib.blake2b(prompt.encode(), digest_size=16)
+        digest.update(repr(sorted(GENERATION_PARAMS.items())).encode())
+        return digest.hexdigest()
+    
     async def generate_video(
         self,
         prompt: str,
         patient_id: str,
         duration: float = 2.0,
-        timeout: float = 300.0
+        timeout: float = 300.0,
+        include_base64: bool = False
     ) -> dict:
         """
         Generate a video from a text prompt using Wan 2.2 Space.
         
+        Concurrent requests for the same patient and prompt share a single
+        generation.
+        
         Args:
             prompt: Text description of the video to generate
             patient_id: Patient ID for filename
             duration: Video duration in seconds (0.3-5)
             timeout: Request timeout in seconds
+            include_base64: Also return the video bytes base64-encoded
             
         Returns:
-            Dictionary with video_path, video_base64, and generation_time
+            Dictionary with video_path, video_filename, generation_time, and
+            video_base64 (None unless include_base64 is set)
         """
         if not self.hf_token:
             raise ValueError("Hugging Face token not configured")
         
+        result = await self._inflight.run(
+            (patient_id, prompt, duration),
+            lambda: self._generate_video(prompt, patient_id, duration, timeout)
+        )
+        
+        video_base64 = None
+        if include_base64:
+            video_base64 = await self.get_base64(result["video_path"])
+        return {**result, "video_base64": video_base64}
+    
+    async def get_base64(self, video_path: str) -> str:
+        """Read a generated video and return it base64-encoded."""
+        return await asyncio.to_thread(_read_base64, video_path)
+    
+    async def _generate_video(
+        self,
+        prompt: str,
+        patient_id: str,
+        duration: float,
+        timeout: float
+    ) -> dict:
+        """Generate a video on the Space and copy it into the output directory."""
+        # Videos are kept on disk under their prompt/params hash, so repeats
+        # survive restarts and skip both the Space call and the copy
+        cached_path = self.output_dir / f"cache_{self._video_cache_key(prompt)}.mp4"
+        if cached_path.exists():
+            logger.info("♻️ Reusing video for identical prompt: %s", cached_path.name)
+            return {
+                "video_path": str(cached_path),
+                "video_filename": cached_path.name,
+                "generation_time": 0.0,
+                "prompt_used": prompt
+            }
+        
         start_time = time.time()
-        print(f"🎬 Generating video with Wan 2.2 for prompt: {prompt[:80]}...")
+        logger.info("🎬 Generating video with Wan 2.2 for prompt: %.80s...", prompt)
         
-        # Run sync gradio client in thread pool
-        loop = asyncio.get_event_loop()
+        # Run sync gradio client in the loop's shared default thread pool
+        loop = asyncio.get_running_loop()
         try:
             video_path_result = await asyncio.wait_for(
-                loop.run_in_executor(_executor, self._generate_sync, prompt, duration),
+                loop.run_in_executor(None, self._generate_sync, prompt, duration),
                 timeout=timeout
             )
         except asyncio.TimeoutError:
             raise TimeoutError(f"Video generation timed out after {timeout}s")
         
-        print(f"📁 Video generated at: {video_path_result}")
-        
-        # Read the generated video
-        async with aiofiles.open(video_path_result, "rb") as f:
-            video_bytes = await f.read()
+        logger.info("📁 Video generated at: %s", video_path_result)
         
-        # Save to our output directory
+        # Move the generated video into our output directory in one worker-thread hop
         timestamp = int(time.time())
         video_filename = f"{patient_id}_{timestamp}.mp4"
         local_video_path = self.output_dir / video_filename
         
-        async with aiofiles.open(local_video_path, "wb") as f:
-            await f.write(video_bytes)
+        await asyncio.to_thread(_transfer_video, video_path_result, local_video_path)
+        
+        try:
+            os.link(local_video_path, cached_path)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            logger.warning("Could not cache video %s: %s", video_filename, e)
         
         generation_time = time.time() - start_time
-        print(f"✅ Video generated in {generation_time:.1f}s: {video_filename}")
+        logger.info("✅ Video generated in %.1fs: %s", generation_time, video_filename)
         
         return {
             "video_path": str(local_video_path),
             "video_filename": video_filename,
-            "video_base64": base64.b64encode(video_bytes).decode(),
             "generation_time": generation_time,
             "prompt_used": prompt
         }
@@ -22,6 +22,7 @@ interface ExplainResponse {
   explanation: Explanation
   video_prompt: string | null
   video_url: string | null
+  video_job_id: string | null
   graph_data: {
     conditions: Array<{ code: string; display: string }>
     medications: Array<{ code: string; display: string }>
@@ -29,6 +30,13 @@ interface ExplainResponse {
   }
 }
 
+interface VideoJob {
+  job_id: string
+  status: 'pending' | 'done' | 'error'
+  video_url: string | null
+  error: string | null
+}
+
 function App() {
   const [selectedPatientId, setSelectedPatientId] = useState<string | null>(null)
   const [generateVideo, setGenerateVideo] = useState(true)
@@ -45,6 +53,19 @@ function App() {
     },
   })
 
+  // Video is generated in the background; poll its job until it settles
+  const videoJobId = explainMutation.data?.video_job_id
+  const videoJobQuery = useQuery({
+    queryKey: ['videoJob', videoJobId],
+    queryFn: async () => {
+      const response = await axios.get<VideoJob>(`${API_BASE}/videos/${videoJobId}`)
+      return response.data
+    },
+    enabled: !!videoJobId,
+    refetchInterval: (query) => (query.state.data?.status === 'pending' ? 3000 : false),
+  })
+  const videoUrl = explainMutation.data?.video_url ?? videoJobQuery.data?.video_url
+
   const handleExplain = () => {
     if (selectedPatientId) {
       explainMutation.mutate(selectedPatientId)
@@ -158,8 +179,13 @@ function App() {
 
           {/* Right Column - Video & Explanation */}
           <div className="lg:col-span-4 space-y-4">
-            {explainMutation.data?.video_url && (
-              <VideoPlayer videoUrl={explainMutation.data.video_url} />
+            {videoUrl && <VideoPlayer videoUrl={videoUrl} />}
+
+            {videoJobQuery.data?.status === 'pending' && (
+              <div className="bg-white rounded-xl shadow-sm p-4 text-sm text-slate-500 flex items-center gap-2">
+                <span className="animate-spin">⏳</span>
+                Generating your video...
+              </div>
             )}
 
             {explainMutation.data?.explanation ? (
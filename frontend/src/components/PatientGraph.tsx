@@ -170,7 +170,7 @@ export default function PatientGraph({ patientId }: PatientGraphProps) {
           },
         },
         initialCypher: `
-          MATCH (p:Patient {id: '${patientId}'})
+          MATCH (p:Patient {id: $patient_id})
           OPTIONAL MATCH (p)-[r1:HAS_CONDITION]->(c:Condition)
           OPTIONAL MATCH (p)-[r2:TAKES_MEDICATION]->(m:Medication)
           OPTIONAL MATCH (c)-[r3:AFFECTS]->(bs:BodySystem)
@@ -183,7 +183,7 @@ export default function PatientGraph({ patientId }: PatientGraphProps) {
 
       try {
         vizRef.current = new window.NeoVis.default(config)
-        vizRef.current.render()
+        vizRef.current.render(config.initialCypher, { patient_id: patientId })
       } catch (error) {
         console.error('Failed to render graph:', error)
       }
@@ -10,26 +10,49 @@ Usage:
 """
 
 import asyncio
-import json
+import io
 import os
+import shutil
 import sys
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from urllib.request import urlretrieve
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
 
-from neo4j import GraphDatabase
-from etl.fhir_to_neo4j import FHIRToNeo4jLoader
+import httpx
+from neo4j import AsyncDriver, AsyncGraphDatabase
+from etl.fhir_to_neo4j import FHIRToNeo4jLoader, shutdown_all
 
 # Synthea sample data URL (small dataset)
 SYNTHEA_SAMPLE_URL = "https://synthetichealth.github.io/synthea-sample-data/downloads/synthea_sample_data_fhir_r4_sep2019.zip"
 
+# Download chunk size for the Synthea archive
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Copy buffer for extracting archive members
+EXTRACT_CHUNK_SIZE = 1 << 20
+
+# Bundles loaded into Neo4j at the same time
+MAX_CONCURRENT_LOADS = 4
+
 # Local paths
 DATA_DIR = Path(__file__).parent.parent / "data"
-SAMPLE_ZIP = DATA_DIR / "synthea_sample.zip"
 SAMPLE_DIR = DATA_DIR / "synthea_samples"
+SAMPLE_BUNDLES_DIR = Path(__file__).parent / "sample_bundles"
+
+
+def _extract_members(archive: bytes, members: list[zipfile.ZipInfo], dest_dir: Path):
+    """Extract members of an in-memory archive into dest_dir, flattening their paths."""
+    # Each worker opens its own ZipFile over the shared bytes, since one ZipFile
+    # isn't safe across threads; opening it once per slice parses the central
+    # directory once per worker rather than once per member
+    with zipfile.ZipFile(io.BytesIO(archive)) as zip_ref:
+        for info in members:
+            with zip_ref.open(info) as src, \
+                    open(dest_dir / os.path.basename(info.filename), "wb") as dst:
+                shutil.copyfileobj(src, dst, EXTRACT_CHUNK_SIZE)
 
 
 def download_synthea_data():
@@ -43,231 +66,58 @@ def download_synthea_data():
     print(f"📥 Downloading Synthea sample data...")
     print(f"   URL: {SYNTHEA_SAMPLE_URL}")
     
-    def progress_hook(count, block_size, total_size):
-        percent = min(100, int(count * block_size * 100 / total_size))
-        sys.stdout.write(f"\r   Progress: {percent}%")
-        sys.stdout.flush()
-    
-    urlretrieve(SYNTHEA_SAMPLE_URL, SAMPLE_ZIP, progress_hook)
+    # Stream in 1 MiB chunks so progress updates once per chunk, not per 8 KiB block;
+    # the archive stays in memory, so it's never written to and re-read from disk
+    buffer = io.BytesIO()
+    with httpx.stream("GET", SYNTHEA_SAMPLE_URL, follow_redirects=True, timeout=60.0) as response:
+        response.raise_for_status()
+        total_size = int(response.headers.get("Content-Length", 0))
+        for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+            buffer.write(chunk)
+            if total_size:
+                percent = min(100, response.num_bytes_downloaded * 100 // total_size)
+                sys.stdout.write(f"\r   Progress: {percent}%")
+                sys.stdout.flush()
+    archive = buffer.getvalue()
+    # Free the download buffer so the archive isn't held twice while extracting;
+    # the workers' BytesIO objects share these bytes without copying them
+    buffer.close()
     print("\n✅ Download complete!")
     
     print("📦 Extracting data...")
     SAMPLE_DIR.mkdir(parents=True, exist_ok=True)
     
-    with zipfile.ZipFile(SAMPLE_ZIP, 'r') as zip_ref:
+    with zipfile.ZipFile(io.BytesIO(archive)) as zip_ref:
         # Extract only FHIR bundle JSON files
-        for file_info in zip_ref.filelist:
-            if file_info.filename.endswith('.json') and 'fhir' in file_info.filename.lower():
-                # Extract to flat directory
-                file_info.filename = os.path.basename(file_info.filename)
-                zip_ref.extract(file_info, SAMPLE_DIR)
+        members = [
+            info for info in zip_ref.infolist()
+            if info.filename.endswith('.json') and 'fhir' in info.filename.lower()
+        ]
     
-    print(f"✅ Extracted to {SAMPLE_DIR}")
+    # Decompress members in parallel, one slice per worker; zlib releases the GIL
+    workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_extract_members, archive, members[i::workers], SAMPLE_DIR)
+            for i in range(min(workers, len(members)))
+        ]
+        for future in futures:
+            future.result()
     
-    # Clean up zip file
-    SAMPLE_ZIP.unlink()
+    print(f"✅ Extracted to {SAMPLE_DIR}")
 
 
 def create_sample_bundles():
-    """Create sample FHIR bundles if Synthea download fails."""
+    """Copy the bundled sample FHIR bundles if Synthea download fails."""
     print("🔧 Creating sample FHIR bundles...")
     
     SAMPLE_DIR.mkdir(parents=True, exist_ok=True)
     
-    # Sample Patient 1: Diabetes with Hypertension
-    bundle1 = {
-        "resourceType": "Bundle",
-        "type": "collection",
-        "entry": [
-            {
-                "resource": {
-                    "resourceType": "Patient",
-                    "id": "patient-001",
-                    "name": [{"given": ["Maria"], "family": "Garcia"}],
-                    "gender": "female",
-                    "birthDate": "1965-03-15"
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "Condition",
-                    "id": "condition-001",
-                    "subject": {"reference": "Patient/patient-001"},
-                    "code": {
-                        "coding": [{"system": "http://snomed.info/sct", "code": "44054006", "display": "Diabetes mellitus type 2"}],
-                        "text": "Type 2 Diabetes"
-                    },
-                    "clinicalStatus": {"coding": [{"code": "active"}]},
-                    "onsetDateTime": "2015-06-20"
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "Condition",
-                    "id": "condition-002",
-                    "subject": {"reference": "Patient/patient-001"},
-                    "code": {
-                        "coding": [{"system": "http://snomed.info/sct", "code": "38341003", "display": "Hypertensive disorder"}],
-                        "text": "Essential Hypertension"
-                    },
-                    "clinicalStatus": {"coding": [{"code": "active"}]},
-                    "onsetDateTime": "2018-01-10"
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "MedicationStatement",
-                    "id": "med-001",
-                    "subject": {"reference": "Patient/patient-001"},
-                    "status": "active",
-                    "medicationCodeableConcept": {
-                        "coding": [{"system": "http://www.nlm.nih.gov/research/umls/rxnorm", "code": "860975", "display": "Metformin 500 MG"}],
-                        "text": "Metformin 500mg"
-                    }
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "MedicationStatement",
-                    "id": "med-002",
-                    "subject": {"reference": "Patient/patient-001"},
-                    "status": "active",
-                    "medicationCodeableConcept": {
-                        "coding": [{"system": "http://www.nlm.nih.gov/research/umls/rxnorm", "code": "197884", "display": "Lisinopril 10 MG"}],
-                        "text": "Lisinopril 10mg"
-                    }
-                }
-            }
-        ]
-    }
-    
-    # Sample Patient 2: Heart Disease
-    bundle2 = {
-        "resourceType": "Bundle",
-        "type": "collection",
-        "entry": [
-            {
-                "resource": {
-                    "resourceType": "Patient",
-                    "id": "patient-002",
-                    "name": [{"given": ["James"], "family": "Wilson"}],
-                    "gender": "male",
-                    "birthDate": "1958-11-22"
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "Condition",
-                    "id": "condition-003",
-                    "subject": {"reference": "Patient/patient-002"},
-                    "code": {
-                        "coding": [{"system": "http://snomed.info/sct", "code": "53741008", "display": "Coronary arteriosclerosis"}],
-                        "text": "Coronary Artery Disease"
-                    },
-                    "clinicalStatus": {"coding": [{"code": "active"}]},
-                    "onsetDateTime": "2019-04-15"
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "Condition",
-                    "id": "condition-004",
-                    "subject": {"reference": "Patient/patient-002"},
-                    "code": {
-                        "coding": [{"system": "http://snomed.info/sct", "code": "13644009", "display": "High cholesterol"}],
-                        "text": "Hypercholesterolemia"
-                    },
-                    "clinicalStatus": {"coding": [{"code": "active"}]},
-                    "onsetDateTime": "2017-08-01"
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "MedicationStatement",
-                    "id": "med-003",
-                    "subject": {"reference": "Patient/patient-002"},
-                    "status": "active",
-                    "medicationCodeableConcept": {
-                        "coding": [{"system": "http://www.nlm.nih.gov/research/umls/rxnorm", "code": "617312", "display": "Atorvastatin 20 MG"}],
-                        "text": "Atorvastatin 20mg"
-                    }
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "MedicationStatement",
-                    "id": "med-004",
-                    "subject": {"reference": "Patient/patient-002"},
-                    "status": "active",
-                    "medicationCodeableConcept": {
-                        "coding": [{"system": "http://www.nlm.nih.gov/research/umls/rxnorm", "code": "308416", "display": "Aspirin 81 MG"}],
-                        "text": "Aspirin 81mg"
-                    }
-                }
-            }
-        ]
-    }
-    
-    # Sample Patient 3: Respiratory Issues
-    bundle3 = {
-        "resourceType": "Bundle",
-        "type": "collection",
-        "entry": [
-            {
-                "resource": {
-                    "resourceType": "Patient",
-                    "id": "patient-003",
-                    "name": [{"given": ["Sarah"], "family": "Johnson"}],
-                    "gender": "female",
-                    "birthDate": "1972-07-08"
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "Condition",
-                    "id": "condition-005",
-                    "subject": {"reference": "Patient/patient-003"},
-                    "code": {
-                        "coding": [{"system": "http://snomed.info/sct", "code": "195967001", "display": "Asthma"}],
-                        "text": "Asthma"
-                    },
-                    "clinicalStatus": {"coding": [{"code": "active"}]},
-                    "onsetDateTime": "1990-05-12"
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "MedicationStatement",
-                    "id": "med-005",
-                    "subject": {"reference": "Patient/patient-003"},
-                    "status": "active",
-                    "medicationCodeableConcept": {
-                        "coding": [{"system": "http://www.nlm.nih.gov/research/umls/rxnorm", "code": "896188", "display": "Albuterol 90 MCG/ACT inhaler"}],
-                        "text": "Albuterol Inhaler"
-                    }
-                }
-            },
-            {
-                "resource": {
-                    "resourceType": "MedicationStatement",
-                    "id": "med-006",
-                    "subject": {"reference": "Patient/patient-003"},
-                    "status": "active",
-                    "medicationCodeableConcept": {
-                        "coding": [{"system": "http://www.nlm.nih.gov/research/umls/rxnorm", "code": "895994", "display": "Fluticasone propionate 250 MCG/ACT inhaler"}],
-                        "text": "Fluticasone Inhaler"
-                    }
-                }
-            }
-        ]
-    }
-    
-    # Write sample bundles
-    for i, bundle in enumerate([bundle1, bundle2, bundle3], 1):
-        filepath = SAMPLE_DIR / f"sample_patient_{i}.json"
-        with open(filepath, 'w') as f:
-            json.dump(bundle, f, indent=2)
-        print(f"   Created {filepath.name}")
+    # Three hand-written patients: diabetes with hypertension, heart disease,
+    # and asthma
+    for src in sorted(SAMPLE_BUNDLES_DIR.glob("*.json")):
+        shutil.copyfile(src, SAMPLE_DIR / src.name)
+        print(f"   Created {src.name}")
     
     print("✅ Sample bundles created!")
 
@@ -281,19 +131,29 @@ async def load_data_to_neo4j():
     
     print(f"\n🔌 Connecting to Neo4j at {neo4j_uri}...")
     
+    # Async driver for the connectivity check and summary, so neither blocks
+    # the event loop; bundle loads run the sync ETL loader in worker threads
+    driver = AsyncGraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
     try:
-        driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-        driver.verify_connectivity()
+        await driver.verify_connectivity()
         print("✅ Connected to Neo4j!")
     except Exception as e:
         print(f"❌ Failed to connect to Neo4j: {e}")
         print("\n💡 Make sure Neo4j is running:")
         print("   docker compose up -d neo4j")
+        await driver.close()
         return
     
-    # Create loader and load bundles
-    loader = FHIRToNeo4jLoader(neo4j_uri, neo4j_user, neo4j_password)
-    
+    try:
+        await _load_bundles(driver, neo4j_uri, neo4j_user, neo4j_password)
+    finally:
+        await driver.close()
+        # The ETL loader shares a process-wide sync driver
+        await asyncio.to_thread(shutdown_all)
+
+
+async def _load_bundles(driver: AsyncDriver, neo4j_uri: str, neo4j_user: str, neo4j_password: str):
+    """Load the sample bundles and print a summary of the graph."""
     # Find FHIR bundle files
     bundle_files = list(SAMPLE_DIR.glob("*.json"))
     if not bundle_files:
@@ -302,40 +162,48 @@ async def load_data_to_neo4j():
     
     print(f"\n📊 Found {len(bundle_files)} FHIR bundles to load")
     
-    # Load each bundle
-    loaded = 0
-    for bundle_file in bundle_files[:10]:  # Limit to 10 for demo
-        print(f"   Loading {bundle_file.name}...", end=" ")
-        try:
-            with open(bundle_file) as f:
-                bundle = json.load(f)
-            
-            await loader.load_bundle(bundle)
-            print("✅")
-            loaded += 1
-        except Exception as e:
-            print(f"⚠️  Error: {e}")
+    # Load bundles concurrently in worker threads; the semaphore bounds how
+    # many Neo4j write transactions run at once
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_LOADS)
+    
+    async def load_one(bundle_file: Path) -> bool:
+        async with semaphore:
+            try:
+                await asyncio.to_thread(loader.load_bundle_file, bundle_file)
+            except Exception as e:
+                print(f"   ⚠️  {bundle_file.name}: {e}")
+                return False
+        print(f"   ✅ {bundle_file.name}")
+        return True
+    
+    # Create loader (sets up constraints) and load bundles
+    loader = await asyncio.to_thread(FHIRToNeo4jLoader, neo4j_uri, neo4j_user, neo4j_password)
+    try:
+        results = await asyncio.gather(
+            *(load_one(bundle_file) for bundle_file in bundle_files[:10])  # Limit to 10 for demo
+        )
+    finally:
+        loader.close()
+    loaded = sum(results)
     
     print(f"\n✅ Successfully loaded {loaded} bundles into Neo4j!")
     
     # Show summary
-    with driver.session() as session:
-        result = session.run("""
-            MATCH (p:Patient) WITH count(p) as patients
-            MATCH (c:Condition) WITH patients, count(c) as conditions
-            MATCH (m:Medication) WITH patients, conditions, count(m) as medications
-            MATCH (bs:BodySystem) WITH patients, conditions, medications, count(bs) as systems
+    async with driver.session() as session:
+        result = await session.run("""
+            CALL { MATCH (p:Patient) RETURN count(p) AS patients }
+            CALL { MATCH (c:Condition) RETURN count(c) AS conditions }
+            CALL { MATCH (m:Medication) RETURN count(m) AS medications }
+            CALL { MATCH (bs:BodySystem) RETURN count(bs) AS systems }
             RETURN patients, conditions, medications, systems
         """)
-        record = result.single()
+        record = await result.single()
         if record:
             print(f"\n📈 Database Summary:")
             print(f"   👤 Patients: {record['patients']}")
             print(f"   🏥 Conditions: {record['conditions']}")
             print(f"   💊 Medications: {record['medications']}")
             print(f"   🫀 Body Systems: {record['systems']}")
-    
-    driver.close()
 
 
 async def main():
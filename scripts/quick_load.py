@@ -10,166 +10,157 @@ password = "healthgraph123"
 
 driver = GraphDatabase.driver(uri, auth=(user, password))
 
+CONSTRAINTS = [
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (p:Patient) REQUIRE p.id IS UNIQUE",
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (c:Condition) REQUIRE c.code IS UNIQUE",
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (m:Medication) REQUIRE m.code IS UNIQUE",
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (bs:BodySystem) REQUIRE bs.name IS UNIQUE",
+]
+
+BODY_SYSTEMS = [
+    {"name": "Cardiovascular", "description": "Heart and blood vessels"},
+    {"name": "Endocrine", "description": "Hormone-producing glands"},
+    {"name": "Respiratory", "description": "Lungs and airways"},
+    {"name": "Nervous", "description": "Brain and nerves"},
+    {"name": "Digestive", "description": "Stomach and intestines"},
+]
+
+# Sample patients; conditions name the body system they affect, medications
+# name the condition code they treat and the body system they target
+PATIENTS = [
+    {
+        "id": "patient-001",
+        "name": "Maria Garcia",
+        "gender": "female",
+        "birthDate": "1965-03-15",
+        "summary": "Diabetes, Hypertension",
+        "conditions": [
+            {"code": "E11", "display": "Type 2 Diabetes Mellitus",
+             "onsetDate": "2015-06-20", "bodySystem": "Endocrine"},
+            {"code": "I10", "display": "Essential Hypertension",
+             "onsetDate": "2018-01-10", "bodySystem": "Cardiovascular"},
+        ],
+        "medications": [
+            {"code": "860975", "display": "Metformin 500mg",
+             "treats": "E11", "targets": "Endocrine"},
+            {"code": "197884", "display": "Lisinopril 10mg",
+             "treats": "I10", "targets": "Cardiovascular"},
+        ],
+    },
+    {
+        "id": "patient-002",
+        "name": "James Wilson",
+        "gender": "male",
+        "birthDate": "1958-11-22",
+        "summary": "Heart Disease",
+        "conditions": [
+            {"code": "I25.10", "display": "Coronary Artery Disease",
+             "onsetDate": "2019-04-15", "bodySystem": "Cardiovascular"},
+            {"code": "E78.0", "display": "Hypercholesterolemia",
+             "onsetDate": "2017-08-01", "bodySystem": "Cardiovascular"},
+        ],
+        "medications": [
+            {"code": "617312", "display": "Atorvastatin 20mg",
+             "treats": "E78.0", "targets": "Cardiovascular"},
+            {"code": "308416", "display": "Aspirin 81mg",
+             "treats": "I25.10", "targets": "Cardiovascular"},
+        ],
+    },
+    {
+        "id": "patient-003",
+        "name": "Sarah Johnson",
+        "gender": "female",
+        "birthDate": "1972-07-08",
+        "summary": "Asthma",
+        "conditions": [
+            {"code": "J45.20", "display": "Mild Persistent Asthma",
+             "onsetDate": "1990-05-12", "bodySystem": "Respiratory"},
+        ],
+        "medications": [
+            {"code": "896188", "display": "Albuterol Inhaler",
+             "treats": "J45.20", "targets": "Respiratory"},
+            {"code": "895994", "display": "Fluticasone Inhaler",
+             "treats": "J45.20", "targets": "Respiratory"},
+        ],
+    },
+]
+
+CLEAR_QUERY = "MATCH (n) DETACH DELETE n"
+
+BODY_SYSTEMS_QUERY = """
+    UNWIND $rows AS row
+    CREATE (:BodySystem {name: row.name, description: row.description})
+"""
+
+# Patients with their conditions and medications; conditions and medications
+# are shared nodes merged on their code
+PATIENT_LOAD_QUERY = """
+    UNWIND $rows AS row
+    CREATE (p:Patient {
+        id: row.id,
+        name: row.name,
+        gender: row.gender,
+        birthDate: row.birthDate
+    })
+    WITH p, row
+    CALL {
+        WITH p, row
+        UNWIND row.conditions AS cond
+        MATCH (bs:BodySystem {name: cond.bodySystem})
+        MERGE (c:Condition {code: cond.code})
+        ON CREATE SET c.display = cond.display,
+                      c.clinicalStatus = 'active'
+        CREATE (p)-[:HAS_CONDITION {onsetDate: cond.onsetDate}]->(c)
+        MERGE (c)-[:AFFECTS]->(bs)
+        RETURN count(c) AS conditions
+    }
+    CALL {
+        WITH p, row
+        UNWIND row.medications AS med
+        MATCH (p)-[:HAS_CONDITION]->(c:Condition {code: med.treats})
+        MATCH (bs:BodySystem {name: med.targets})
+        MERGE (m:Medication {code: med.code})
+        ON CREATE SET m.display = med.display,
+                      m.status = 'active'
+        CREATE (p)-[:TAKES_MEDICATION]->(m)
+        MERGE (m)-[:TREATS]->(c)
+        MERGE (m)-[:TARGETS]->(bs)
+        RETURN count(m) AS medications
+    }
+    RETURN count(p) AS patients
+"""
+
+SUMMARY_QUERY = """
+    CALL { MATCH (p:Patient) RETURN count(p) AS patients }
+    CALL { MATCH (c:Condition) RETURN count(c) AS conditions }
+    CALL { MATCH (m:Medication) RETURN count(m) AS medications }
+    CALL { MATCH (bs:BodySystem) RETURN count(bs) AS systems }
+    RETURN patients, conditions, medications, systems
+"""
+
+
 def clear_and_load():
+    def load(tx):
+        tx.run(CLEAR_QUERY)
+        tx.run(BODY_SYSTEMS_QUERY, rows=BODY_SYSTEMS)
+        tx.run(PATIENT_LOAD_QUERY, rows=PATIENTS).consume()
+    
     with driver.session() as session:
-        # Clear existing data
-        session.run("MATCH (n) DETACH DELETE n")
-        print("✅ Cleared existing data")
+        # Index the lookup keys before loading (same constraints as the ETL);
+        # schema changes can't share a transaction with the data writes
+        for constraint in CONSTRAINTS:
+            session.run(constraint).consume()
+        print("✅ Created constraints")
         
-        # Create body systems
-        session.run("""
-            CREATE (bs1:BodySystem {name: 'Cardiovascular', description: 'Heart and blood vessels'})
-            CREATE (bs2:BodySystem {name: 'Endocrine', description: 'Hormone-producing glands'})
-            CREATE (bs3:BodySystem {name: 'Respiratory', description: 'Lungs and airways'})
-            CREATE (bs4:BodySystem {name: 'Nervous', description: 'Brain and nerves'})
-            CREATE (bs5:BodySystem {name: 'Digestive', description: 'Stomach and intestines'})
-        """)
+        # Clear and reload everything in one transaction with a single commit
+        session.execute_write(load)
+        print("✅ Cleared existing data")
         print("✅ Created body systems")
-        
-        # Patient 1: Maria Garcia - Diabetes & Hypertension
-        session.run("""
-            CREATE (p:Patient {
-                id: 'patient-001',
-                name: 'Maria Garcia',
-                gender: 'female',
-                birthDate: '1965-03-15'
-            })
-            CREATE (c1:Condition {
-                code: 'E11',
-                display: 'Type 2 Diabetes Mellitus',
-                clinicalStatus: 'active',
-                onsetDate: '2015-06-20'
-            })
-            CREATE (c2:Condition {
-                code: 'I10',
-                display: 'Essential Hypertension',
-                clinicalStatus: 'active',
-                onsetDate: '2018-01-10'
-            })
-            CREATE (m1:Medication {
-                code: '860975',
-                display: 'Metformin 500mg',
-                status: 'active'
-            })
-            CREATE (m2:Medication {
-                code: '197884',
-                display: 'Lisinopril 10mg',
-                status: 'active'
-            })
-            
-            // Create relationships
-            CREATE (p)-[:HAS_CONDITION]->(c1)
-            CREATE (p)-[:HAS_CONDITION]->(c2)
-            CREATE (p)-[:TAKES_MEDICATION]->(m1)
-            CREATE (p)-[:TAKES_MEDICATION]->(m2)
-            
-            // Link to body systems
-            WITH p, c1, c2, m1, m2
-            MATCH (bs1:BodySystem {name: 'Endocrine'})
-            MATCH (bs2:BodySystem {name: 'Cardiovascular'})
-            CREATE (c1)-[:AFFECTS]->(bs1)
-            CREATE (c2)-[:AFFECTS]->(bs2)
-            CREATE (m1)-[:TREATS]->(c1)
-            CREATE (m1)-[:TARGETS]->(bs1)
-            CREATE (m2)-[:TREATS]->(c2)
-            CREATE (m2)-[:TARGETS]->(bs2)
-        """)
-        print("✅ Created Patient 1: Maria Garcia (Diabetes, Hypertension)")
-        
-        # Patient 2: James Wilson - Heart Disease
-        session.run("""
-            CREATE (p:Patient {
-                id: 'patient-002',
-                name: 'James Wilson',
-                gender: 'male',
-                birthDate: '1958-11-22'
-            })
-            CREATE (c1:Condition {
-                code: 'I25.10',
-                display: 'Coronary Artery Disease',
-                clinicalStatus: 'active',
-                onsetDate: '2019-04-15'
-            })
-            CREATE (c2:Condition {
-                code: 'E78.0',
-                display: 'Hypercholesterolemia',
-                clinicalStatus: 'active',
-                onsetDate: '2017-08-01'
-            })
-            CREATE (m1:Medication {
-                code: '617312',
-                display: 'Atorvastatin 20mg',
-                status: 'active'
-            })
-            CREATE (m2:Medication {
-                code: '308416',
-                display: 'Aspirin 81mg',
-                status: 'active'
-            })
-            
-            CREATE (p)-[:HAS_CONDITION]->(c1)
-            CREATE (p)-[:HAS_CONDITION]->(c2)
-            CREATE (p)-[:TAKES_MEDICATION]->(m1)
-            CREATE (p)-[:TAKES_MEDICATION]->(m2)
-            
-            WITH p, c1, c2, m1, m2
-            MATCH (bs:BodySystem {name: 'Cardiovascular'})
-            CREATE (c1)-[:AFFECTS]->(bs)
-            CREATE (c2)-[:AFFECTS]->(bs)
-            CREATE (m1)-[:TREATS]->(c2)
-            CREATE (m1)-[:TARGETS]->(bs)
-            CREATE (m2)-[:TREATS]->(c1)
-            CREATE (m2)-[:TARGETS]->(bs)
-        """)
-        print("✅ Created Patient 2: James Wilson (Heart Disease)")
-        
-        # Patient 3: Sarah Johnson - Asthma
-        session.run("""
-            CREATE (p:Patient {
-                id: 'patient-003',
-                name: 'Sarah Johnson',
-                gender: 'female',
-                birthDate: '1972-07-08'
-            })
-            CREATE (c1:Condition {
-                code: 'J45.20',
-                display: 'Mild Persistent Asthma',
-                clinicalStatus: 'active',
-                onsetDate: '1990-05-12'
-            })
-            CREATE (m1:Medication {
-                code: '896188',
-                display: 'Albuterol Inhaler',
-                status: 'active'
-            })
-            CREATE (m2:Medication {
-                code: '895994',
-                display: 'Fluticasone Inhaler',
-                status: 'active'
-            })
-            
-            CREATE (p)-[:HAS_CONDITION]->(c1)
-            CREATE (p)-[:TAKES_MEDICATION]->(m1)
-            CREATE (p)-[:TAKES_MEDICATION]->(m2)
-            
-            WITH p, c1, m1, m2
-            MATCH (bs:BodySystem {name: 'Respiratory'})
-            CREATE (c1)-[:AFFECTS]->(bs)
-            CREATE (m1)-[:TREATS]->(c1)
-            CREATE (m1)-[:TARGETS]->(bs)
-            CREATE (m2)-[:TREATS]->(c1)
-            CREATE (m2)-[:TARGETS]->(bs)
-        """)
-        print("✅ Created Patient 3: Sarah Johnson (Asthma)")
+        for patient in PATIENTS:
+            print(f"✅ Created {patient['name']} ({patient['summary']})")
         
         # Verify
-        result = session.run("""
-            MATCH (p:Patient) WITH count(p) as patients
-            MATCH (c:Condition) WITH patients, count(c) as conditions
-            MATCH (m:Medication) WITH patients, conditions, count(m) as medications
-            MATCH (bs:BodySystem) WITH patients, conditions, medications, count(bs) as systems
-            RETURN patients, conditions, medications, systems
-        """)
+        result = session.run(SUMMARY_QUERY)
         record = result.single()
         print(f"\n📊 Database Summary:")
         print(f"   👤 Patients: {record['patients']}")